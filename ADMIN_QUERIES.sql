@@ -1,6 +1,10 @@
 """
 SQL запросы для администратора
 Используйте эти запросы для анализа данных и управления ботом
+
+Таблица bookings содержит только актуальные записи: неактивные записи старше
+ARCHIVE_AFTER_DAYS дней переносятся в bookings_archive. Для истории и
+аналитики за всё время используйте представление bookings_all.
 """
 
 # ============================================
@@ -13,8 +17,11 @@ SELECT COUNT(*) as total_users FROM users;
 # Всего активных записей
 SELECT COUNT(*) as total_bookings FROM bookings WHERE status = 'active';
 
-# Всего отмененных записей
-SELECT COUNT(*) as cancelled_bookings FROM bookings WHERE status = 'cancelled';
+# Всего отмененных записей (за всё время)
+SELECT COUNT(*) as cancelled_bookings FROM bookings_all WHERE status = 'cancelled';
+
+# Всего выполненных записей (за всё время)
+SELECT COUNT(*) as completed_bookings FROM bookings_all WHERE status = 'completed';
 
 # Записи на сегодня
 SELECT COUNT(*) as today_bookings FROM bookings 
@@ -40,6 +47,13 @@ WHERE status = 'active'
 GROUP BY service 
 ORDER BY count DESC;
 
+# Популярность услуг за всё время
+SELECT service, COUNT(*) as count 
+FROM bookings_all 
+WHERE status = 'completed' 
+GROUP BY service 
+ORDER BY count DESC;
+
 # Доход по услугам (если добавить цены)
 SELECT 
     service,
@@ -145,12 +159,12 @@ WHERE status = 'active'
 ORDER BY booking_date, booking_time;
 
 # Все отмененные записи
-SELECT * FROM bookings 
+SELECT * FROM bookings_all 
 WHERE status = 'cancelled' 
 ORDER BY booking_date, booking_time;
 
-# Записи конкретного пользователя
-SELECT * FROM bookings 
+# Записи конкретного пользователя (вся история)
+SELECT * FROM bookings_all 
 WHERE user_id = ? 
 ORDER BY booking_date, booking_time;
 
@@ -251,6 +265,16 @@ WHERE status = 'active'
 GROUP BY month 
 ORDER BY month DESC;
 
+# Месячный отчет по выполненным записям за всё время
+SELECT 
+    strftime('%Y-%m', booking_date) as month,
+    COUNT(*) as completed_bookings,
+    COUNT(DISTINCT user_id) as unique_users
+FROM bookings_all 
+WHERE status = 'completed' 
+GROUP BY month 
+ORDER BY month DESC;
+
 # ============================================
 # ЭКСПОРТ ДАННЫХ
 # ============================================
@@ -267,7 +291,7 @@ SELECT
     b.booking_time,
     b.status,
     b.created_at
-FROM bookings b 
+FROM bookings_all b 
 JOIN users u ON b.user_id = u.user_id 
 ORDER BY b.booking_date, b.booking_time;
 .output stdout
@@ -276,15 +300,15 @@ ORDER BY b.booking_date, b.booking_time;
 # ��ЧИСТКА ДАННЫХ
 # ============================================
 
-# Удаление старых отмененных записей (старше 30 дней)
-DELETE FROM bookings 
-WHERE status = 'cancelled' 
-AND created_at < datetime('now', '-30 days');
+# Старые неактивные записи бот переносит в архив сам (Database.archive_bookings).
+# Размер живой таблицы и архива
+SELECT 
+    (SELECT COUNT(*) FROM bookings) as live_bookings,
+    (SELECT COUNT(*) FROM bookings_archive) as archived_bookings;
 
-# Удаление записей в прошлом
-DELETE FROM bookings 
-WHERE booking_date < DATE('now') 
-AND status = 'active';
+# Удаление архивных записей старше года (осторожно!)
+DELETE FROM bookings_archive 
+WHERE booking_date < DATE('now', '-1 year');
 
 # ============================================
 # ОПТИМИЗАЦИЯ БД
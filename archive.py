@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL, ARCHIVE_START_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveJob:
+    """Периодический перенос старых неактивных записей в bookings_archive.
+
+    Живая таблица bookings остаётся размером примерно с окно записи, а
+    история доступна через представление bookings_all.
+    """
+
+    def __init__(self, db, interval=ARCHIVE_INTERVAL, older_than_days=ARCHIVE_AFTER_DAYS,
+                 start_delay=ARCHIVE_START_DELAY):
+        """db — AsyncDatabase"""
+        self.db = db
+        self.interval = interval
+        self.start_delay = start_delay
+        self.older_than_days = older_than_days
+        self.archived = 0
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self):
+        """Перенести в архив всё, что подходит по возрасту"""
+        archived = await self.db.archive_bookings(self.older_than_days)
+        if archived:
+            logger.info(f"🗄 Перенесено в архив записей: {archived}")
+            self.archived += archived
+        return archived
+
+    async def _run(self):
+        await asyncio.sleep(self.start_delay)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Ошибка архивации записей: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,237 @@
+"""
+Микро-бенчмарки методов Database на объёмах, близких к боевым.
+
+Заполняет отдельный файл БД записями (по умолчанию 10^4, 10^5 и 10^6) со
+смешанными статусами и множеством пользователей и замеряет горячие методы:
+на холодном старте (новый объект Database — пустые пул подключений и кэш
+доступности) и на прогретом (повторные вызовы того же объекта).
+Результат печатается в JSON, чтобы сравнивать релизы между собой.
+
+Примеры:
+    python bench_db.py
+    python bench_db.py --sizes 100000 --repeat 200 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from config import CAR_BODY_TYPES, WASH_TYPES, DAYS_AHEAD
+from database import BookingResult, Database
+from timetable import SLOT_TIMES, wash_duration
+
+# Сколько дней истории генерировать для неактивных записей
+HISTORY_DAYS = 365
+
+
+def seed(db_path, bookings, users, stale_active, rng):
+    """Заполнить БД пользователями и записями.
+
+    Будущие записи активны с соблюдением вместимости слотов, прошлые —
+    completed/cancelled; stale_active прошлых записей оставлены активными,
+    как если бы их не успели завершить.
+    """
+    db = Database(db_path)
+    conn = db.get_connection()
+    today = datetime.now().date()
+    bodies, washes = list(CAR_BODY_TYPES), list(WASH_TYPES)
+
+    conn.executemany(
+        'INSERT OR IGNORE INTO users (user_id, username, first_name, phone) VALUES (?, ?, ?, ?)',
+        ((user_id, f'user{user_id}', f'User{user_id}', f'+7999{user_id:07d}') for user_id in range(1, users + 1))
+    )
+
+    def rows():
+        # Будущее окно: не больше 2 записей на слот, остальное — история
+        for offset in range(1, DAYS_AHEAD + 1):
+            date_str = (today + timedelta(days=offset)).strftime('%Y-%m-%d')
+            for time_str in SLOT_TIMES:
+                for _ in range(rng.randint(0, 2)):
+                    yield date_str, time_str, 'active'
+        for i in range(bookings):
+            date_str = (today - timedelta(days=rng.randint(1, HISTORY_DAYS))).strftime('%Y-%m-%d')
+            if i < stale_active:
+                status = 'active'
+            else:
+                status = 'completed' if rng.random() < 0.8 else 'cancelled'
+            yield date_str, rng.choice(SLOT_TIMES), status
+
+    conn.executemany('''
+        INSERT OR IGNORE INTO bookings
+        (user_id, booking_date, booking_time, service, phone, car_body_type, wash_type, duration, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        (user_id, date_str, time_str, f'{CAR_BODY_TYPES[body]} - {WASH_TYPES[wash]}', f'+7999{user_id:07d}',
+         body, wash, wash_duration(body, wash), status)
+        for (date_str, time_str, status), user_id, body, wash in (
+            (row, rng.randint(1, users), rng.choice(bodies), rng.choice(washes)) for row in rows()
+        )
+    ))
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    db.close()
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 4),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 4),
+        'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 4),
+        'max_ms': round(samples[-1] * 1000, 4),
+    }
+
+
+class Workload:
+    """Аргументы для каждого замеряемого метода.
+
+    add_booking возвращает исход бронирования: быстрые отказы (slot_full)
+    сводятся отдельно от созданных записей.
+    """
+
+    def __init__(self, users, rng):
+        self.rng = rng
+        self.users = users
+        self.dates = [(datetime.now().date() + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(1, DAYS_AHEAD + 1)]
+        self._next_user = users + 1
+        self._to_cancel = []
+
+    def methods(self):
+        """{имя: функция(db)} — по одному вызову метода"""
+        return {
+            'get_available_dates': lambda db: db.get_available_dates(),
+            'get_available_times': lambda db: db.get_available_times(self.rng.choice(self.dates)),
+            'get_available_times_truck': lambda db: db.get_available_times(self.rng.choice(self.dates), 'truck', 'double'),
+            'get_user_bookings': lambda db: db.get_user_bookings(self.rng.randint(1, self.users)),
+            'get_all_bookings': lambda db: db.get_all_bookings(),
+            'get_bookings_page': lambda db: db.get_bookings_page(),
+            'add_booking': self.add_booking,
+            'cancel_booking': self.cancel_booking,
+            'remove_expired_bookings': lambda db: db.remove_expired_bookings(),
+        }
+
+    def new_user(self):
+        # Новые пользователи, чтобы запись не отклонялась как дубликат
+        user_id = self._next_user
+        self._next_user += 1
+        return user_id
+
+    def prepare(self, name, db, calls):
+        """Подготовить данные для calls вызовов метода — вне замеров"""
+        if name != 'cancel_booking':
+            return
+        # Вставка в обход проверки постов: для отмены вместимость слота не важна
+        conn = db.get_connection()
+        for _ in range(calls):
+            user_id = self.new_user()
+            cursor = conn.execute('''
+                INSERT INTO bookings
+                (user_id, booking_date, booking_time, service, phone, car_body_type, wash_type, duration)
+                VALUES (?, ?, ?, 'Седан - Однофазная мойка', '+79990000000', 'sedan', 'single', ?)
+            ''', (user_id, self.rng.choice(self.dates), self.rng.choice(SLOT_TIMES), wash_duration('sedan', 'single')))
+            self._to_cancel.append((cursor.lastrowid, user_id))
+        conn.commit()
+        conn.close()
+
+    def add_booking(self, db):
+        booking_date, booking_time = self.rng.choice(self.dates), self.rng.choice(SLOT_TIMES)
+        return db.book_slot(self.new_user(), booking_date, booking_time, 'Седан - Однофазная мойка', '+79990000000', 'sedan', 'single')
+
+    def cancel_booking(self, db):
+        booking_id, user_id = self._to_cancel.pop()
+        db.cancel_booking(booking_id, user_id)
+
+
+def bench_size(size, users, repeat, cold_runs, db_path, seed_value):
+    rng = random.Random(seed_value)
+    started = time.perf_counter()
+    seed(db_path, size, users, stale_active=size // 100, rng=rng)
+    seed_s = time.perf_counter() - started
+
+    workload = Workload(users, rng)
+    results = {}
+    for name, call in workload.methods().items():
+        db = Database(db_path)
+        workload.prepare(name, db, cold_runs + 1 + repeat)
+        db.close()
+
+        # Отказы бронирования сводятся отдельно — под именем name_<исход>
+        samples = {}
+
+        def measure(phase, db):
+            started = time.perf_counter()
+            outcome = call(db)
+            elapsed = time.perf_counter() - started
+            rejected = isinstance(outcome, BookingResult) and outcome is not BookingResult.BOOKED
+            key = f'{name}_{outcome.value}' if rejected else name
+            samples.setdefault(key, {'cold': [], 'warm': []})[phase].append(elapsed)
+
+        # Холодный старт: новый объект Database, пустые кэши и подключения
+        for _ in range(cold_runs):
+            db = Database(db_path)
+            measure('cold', db)
+            db.close()
+
+        db = Database(db_path)
+        call(db)  # прогрев
+        for _ in range(repeat):
+            measure('warm', db)
+        db.close()
+
+        for key, phases in samples.items():
+            results[key] = {phase: summarize(values) for phase, values in phases.items() if values}
+
+    db = Database(db_path)
+    conn = db.get_connection()
+    live = conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
+    conn.close()
+    db.close()
+    return {
+        'bookings': size,
+        'users': users,
+        'live_rows': live,
+        'seed_s': round(seed_s, 2),
+        'db_size_mb': round(os.path.getsize(db_path) / 2 ** 20, 2),
+        'methods': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк методов Database на больших объёмах')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6], help='число записей в прогонах')
+    parser.add_argument('--users', type=int, help='число пользователей (по умолчанию — записей / 10)')
+    parser.add_argument('--repeat', type=int, default=100, help='вызовов каждого метода на прогретой БД')
+    parser.add_argument('--cold-runs', type=int, default=5, help='замеров холодного старта на метод')
+    parser.add_argument('--seed', type=int, default=1, help='зерно генератора данных')
+    parser.add_argument('--db-dir', help='каталог для файлов БД (по умолчанию — временный)')
+    parser.add_argument('--output', help='сохранить отчёт в JSON-файл')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.db_dir) as db_dir:
+        runs = []
+        for size in args.sizes:
+            db_path = os.path.join(db_dir, f'bench_{size}.db')
+            runs.append(bench_size(size, args.users or max(size // 10, 100), args.repeat, args.cold_runs, db_path, args.seed))
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'repeat': args.repeat,
+        'cold_runs': args.cold_runs,
+        'runs': runs,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
+import html
 import logging
-from datetime import datetime, timedelta
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -10,34 +11,54 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
-from config import BOT_TOKEN, ADMIN_USER_ID, CAR_BODY_TYPES, WASH_TYPES
-from database import Database
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from config import (
+    BOT_TOKEN, ADMIN_USER_ID, CAR_BODY_TYPES, WASH_TYPES, WASH_DURATIONS, ADMIN_DAY_BUTTONS,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    UPDATE_CONCURRENCY, METRICS_HOST, METRICS_PORT
 )
-logger = logging.getLogger(__name__)
-
-# Инициализация БД
-db = Database()
+from archive import ArchiveJob
+from database import AsyncDatabase, BookingResult, Database
+from expiry import ExpiryScheduler
+from keyboards import Keyboards
+from metrics import Metrics, MetricsServer
+from notifications import NotificationQueue
+from ordering import PerUserOrderedApplication
+from persistence import SQLitePersistence
+from sender import RateLimitedSender
+from timetable import DATE_TABLE, wash_duration
 
-# Глобальная переменная для хранения объекта приложения
-app = None
+logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
 SELECT_ACTION, SELECT_CAR_BODY, SELECT_WASH_TYPE, SELECT_DATE, SELECT_TIME, ENTER_PHONE, CONFIRM_BOOKING = range(7)
 
+# Имена состояний для метрик переходов
+STATE_NAMES = {
+    SELECT_ACTION: 'SELECT_ACTION',
+    SELECT_CAR_BODY: 'SELECT_CAR_BODY',
+    SELECT_WASH_TYPE: 'SELECT_WASH_TYPE',
+    SELECT_DATE: 'SELECT_DATE',
+    SELECT_TIME: 'SELECT_TIME',
+    ENTER_PHONE: 'ENTER_PHONE',
+    CONFIRM_BOOKING: 'CONFIRM_BOOKING',
+    ConversationHandler.END: 'END',
+}
+
 
 class CarWashBot:
-    def __init__(self):
-        pass
+    def __init__(self, db: AsyncDatabase, notifications: NotificationQueue, sender: RateLimitedSender,
+                 expiry: ExpiryScheduler, metrics: Metrics):
+        self.db = db
+        self.notifications = notifications
+        self.sender = sender
+        self.expiry = expiry
+        self.metrics = metrics
+        self.keyboards = Keyboards()
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
-        db.add_user(user.id, user.username, user.first_name)
+        await self.db.add_user(user.id, user.username, user.first_name)
         logger.info(f"👤 Пользователь {user.first_name} (ID: {user.id}) запустил бота")
 
         welcome_text = (
@@ -51,18 +72,12 @@ class CarWashBot:
             f"Что вы хотите сделать?"
         )
 
-        keyboard = [
-            [InlineKeyboardButton("📝 Записаться", callback_data="book_wash")],
-            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
-        ]
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.keyboards.start_menu
 
         if update.message:
-            await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='HTML')
+            await self.sender.reply_text(update.message, welcome_text, reply_markup=reply_markup, parse_mode='HTML')
         elif update.callback_query:
-            await update.callback_query.edit_message_text(welcome_text, reply_markup=reply_markup, parse_mode='HTML')
+            await self.sender.edit_query_message(update.callback_query, welcome_text, reply_markup=reply_markup, parse_mode='HTML')
 
         return SELECT_ACTION
 
@@ -90,18 +105,12 @@ class CarWashBot:
             "🚗 Ждём вас на мойке!"
         )
 
-        keyboard = [
-            [InlineKeyboardButton("📝 Записаться", callback_data="book_wash")],
-            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
-            [InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_menu")]
-        ]
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.keyboards.help_menu
 
         if update.message:
-            await update.message.reply_text(help_text, reply_markup=reply_markup, parse_mode='HTML')
+            await self.sender.reply_text(update.message, help_text, reply_markup=reply_markup, parse_mode='HTML')
         elif update.callback_query:
-            await update.callback_query.edit_message_text(help_text, reply_markup=reply_markup, parse_mode='HTML')
+            await self.sender.edit_query_message(update.callback_query, help_text, reply_markup=reply_markup, parse_mode='HTML')
 
         return SELECT_ACTION
 
@@ -121,15 +130,8 @@ class CarWashBot:
             "Что вы хотите сделать?"
         )
 
-        keyboard = [
-            [InlineKeyboardButton("📝 Записаться", callback_data="book_wash")],
-            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
-            [InlineKeyboardButton("❓ Помощь", callback_data="help_info")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
-        ]
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(welcome_text, reply_markup=reply_markup, parse_mode='HTML')
+        reply_markup = self.keyboards.main_menu
+        await self.sender.edit_query_message(query, welcome_text, reply_markup=reply_markup, parse_mode='HTML')
         return SELECT_ACTION
 
     async def select_action(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -138,7 +140,7 @@ class CarWashBot:
         await query.answer()
 
         if query.data == "cancel":
-            await query.edit_message_text("❌ Операция отменена.")
+            await self.sender.edit_query_message(query, "❌ Операция отменена.")
             return ConversationHandler.END
 
         if query.data == "my_bookings":
@@ -155,14 +157,9 @@ class CarWashBot:
             return await self.cancel_booking_handler(update, context)
 
         if query.data == "book_wash":
-            keyboard = []
-            for body_key, body_name in CAR_BODY_TYPES.items():
-                keyboard.append([InlineKeyboardButton(body_name, callback_data=f"body_{body_key}")])
-            keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")])
-
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.keyboards.car_body
             text = "🚗 Выберите тип кузова вашего автомобиля:"
-            await query.edit_message_text(text, reply_markup=reply_markup)
+            await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
             return SELECT_CAR_BODY
 
         return SELECT_ACTION
@@ -179,14 +176,9 @@ class CarWashBot:
         context.user_data['car_body_type'] = body_key
         context.user_data['car_body_name'] = CAR_BODY_TYPES[body_key]
 
-        keyboard = []
-        for wash_key, wash_name in WASH_TYPES.items():
-            keyboard.append([InlineKeyboardButton(wash_name, callback_data=f"wash_{wash_key}")])
-        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_body")])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.keyboards.wash_type
         text = f"🚗 Тип кузова: {context.user_data['car_body_name']}\n\n💧 Выберите тип мойки:"
-        await query.edit_message_text(text, reply_markup=reply_markup)
+        await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
         return SELECT_WASH_TYPE
 
     async def select_wash_type(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -195,41 +187,27 @@ class CarWashBot:
         await query.answer()
 
         if query.data == "back_to_body":
-            keyboard = []
-            for body_key, body_name in CAR_BODY_TYPES.items():
-                keyboard.append([InlineKeyboardButton(body_name, callback_data=f"body_{body_key}")])
-            keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")])
-
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.keyboards.car_body
             text = "🚗 Выберите тип кузова вашего автомобиля:"
-            await query.edit_message_text(text, reply_markup=reply_markup)
+            await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
             return SELECT_CAR_BODY
 
         wash_key = query.data.replace("wash_", "")
         context.user_data['wash_type'] = wash_key
         context.user_data['wash_type_name'] = WASH_TYPES[wash_key]
 
-        available_dates = db.get_available_dates()
+        available_dates = await self.db.get_available_dates(context.user_data['car_body_type'], wash_key)
         if not available_dates:
-            await query.edit_message_text("😞 К сожалению, нет доступных дат для записи.")
+            await self.sender.edit_query_message(query, "😞 К сожалению, нет доступных дат для записи.")
             return ConversationHandler.END
 
-        keyboard = []
-        for date in available_dates:
-            date_str = date.strftime('%d.%m.%Y')
-            day_name = self.get_day_name(date.weekday())
-            keyboard.append([
-                InlineKeyboardButton(f"{day_name}, {date_str}", callback_data=f"date_{date.strftime('%Y-%m-%d')}")
-            ])
-        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_wash")])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.keyboards.dates(available_dates)
         text = (
             f"🚗 Тип кузова: {context.user_data['car_body_name']}\n"
             f"💧 Тип мойки: {context.user_data['wash_type_name']}\n\n"
             f"📅 Выберите дату:"
         )
-        await query.edit_message_text(text, reply_markup=reply_markup)
+        await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
         return SELECT_DATE
 
     async def select_date(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -238,46 +216,33 @@ class CarWashBot:
         await query.answer()
 
         if query.data == "back_to_wash":
-            keyboard = []
-            for wash_key, wash_name in WASH_TYPES.items():
-                keyboard.append([InlineKeyboardButton(wash_name, callback_data=f"wash_{wash_key}")])
-            keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_body")])
-
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.keyboards.wash_type
             text = f"🚗 Тип кузова: {context.user_data['car_body_name']}\n\n💧 Выберите тип мойки:"
-            await query.edit_message_text(text, reply_markup=reply_markup)
+            await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
             return SELECT_WASH_TYPE
 
         date_str = query.data.replace("date_", "")
         context.user_data['booking_date'] = date_str
 
-        available_times = db.get_available_times(date_str)
+        available_times = await self.db.get_available_times(
+            date_str, context.user_data['car_body_type'], context.user_data['wash_type']
+        )
         if not available_times:
-            await query.edit_message_text("😞 К сожалению, на эту дату нет свободного времени.")
+            await self.sender.edit_query_message(query, "😞 К сожалению, на эту дату нет свободного времени.")
             return SELECT_DATE
 
-        keyboard = []
-        for time_slot in available_times:
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"⏰ {time_slot['time']} ({time_slot['available']} мест)",
-                    callback_data=f"time_{time_slot['time']}"
-                )
-            ])
-        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_dates")])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-        date_formatted = date_obj.strftime('%d.%m.%Y')
-        day_name = self.get_day_name(date_obj.weekday())
+        reply_markup = self.keyboards.times(available_times)
+        day = DATE_TABLE.get(date_str)
+        duration = wash_duration(context.user_data['car_body_type'], context.user_data['wash_type'])
 
         text = (
             f"🚗 Тип кузова: {context.user_data['car_body_name']}\n"
             f"💧 Тип мойки: {context.user_data['wash_type_name']}\n"
-            f"📅 Дата: {day_name}, {date_formatted}\n\n"
+            f"📅 Дата: {day.label}\n"
+            f"⏱ Длительность: {duration} мин\n\n"
             f"⏰ Выберите время:"
         )
-        await query.edit_message_text(text, reply_markup=reply_markup)
+        await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
         return SELECT_TIME
 
     async def select_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -286,40 +251,32 @@ class CarWashBot:
         await query.answer()
 
         if query.data == "back_to_dates":
-            available_dates = db.get_available_dates()
-            keyboard = []
-            for date in available_dates:
-                date_str = date.strftime('%d.%m.%Y')
-                day_name = self.get_day_name(date.weekday())
-                keyboard.append([
-                    InlineKeyboardButton(f"{day_name}, {date_str}", callback_data=f"date_{date.strftime('%Y-%m-%d')}")
-                ])
-            keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_wash")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            available_dates = await self.db.get_available_dates(
+                context.user_data['car_body_type'], context.user_data['wash_type']
+            )
+            reply_markup = self.keyboards.dates(available_dates)
 
             text = (
                 f"🚗 Тип кузова: {context.user_data['car_body_name']}\n"
                 f"💧 Тип мойки: {context.user_data['wash_type_name']}\n\n"
                 f"📅 Выберите дату:"
             )
-            await query.edit_message_text(text, reply_markup=reply_markup)
+            await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
             return SELECT_DATE
 
         time_str = query.data.replace("time_", "")
         context.user_data['booking_time'] = time_str
 
-        date_obj = datetime.strptime(context.user_data['booking_date'], '%Y-%m-%d').date()
-        date_formatted = date_obj.strftime('%d.%m.%Y')
-        day_name = self.get_day_name(date_obj.weekday())
+        day = DATE_TABLE.get(context.user_data['booking_date'])
 
         text = (
             f"📞 Введите ваш номер телефона в формате: +7XXXXXXXXXX\n\n"
             f"🚗 Тип кузова: {context.user_data['car_body_name']}\n"
             f"💧 Тип мойки: {context.user_data['wash_type_name']}\n"
-            f"📅 Дата: {day_name}, {date_formatted}\n"
+            f"📅 Дата: {day.label}\n"
             f"⏰ Время: {context.user_data['booking_time']}"
         )
-        await query.edit_message_text(text)
+        await self.sender.edit_query_message(query, text)
         return ENTER_PHONE
 
     async def enter_phone(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -327,38 +284,30 @@ class CarWashBot:
         phone = update.message.text.strip()
 
         if not self.validate_phone(phone):
-            await update.message.reply_text(
+            await self.sender.reply_text(
+                update.message,
                 "❌ Неверный формат номера телефона.\n"
                 "Пожалуйста, введите номер в формате: +7XXXXXXXXXX"
             )
             return ENTER_PHONE
 
         context.user_data['phone'] = phone
-        db.update_user_phone(update.effective_user.id, phone)
+        await self.db.update_user_phone(update.effective_user.id, phone)
 
-        date_obj = datetime.strptime(context.user_data['booking_date'], '%Y-%m-%d').date()
-        date_formatted = date_obj.strftime('%d.%m.%Y')
-        day_name = self.get_day_name(date_obj.weekday())
+        day = DATE_TABLE.get(context.user_data['booking_date'])
 
         confirmation_text = (
             f"✅ Подтвердите вашу запись:\n\n"
             f"🚗 Тип кузова: {context.user_data['car_body_name']}\n"
             f"💧 Тип мойки: {context.user_data['wash_type_name']}\n"
-            f"📅 Дата: {day_name}, {date_formatted}\n"
+            f"📅 Дата: {day.label}\n"
             f"⏰ Время: {context.user_data['booking_time']}\n"
             f"📞 Телефон: {phone}\n\n"
             f"Все верно?"
         )
 
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_yes"),
-                InlineKeyboardButton("❌ Отменить", callback_data="confirm_no")
-            ]
-        ]
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(confirmation_text, reply_markup=reply_markup)
+        reply_markup = self.keyboards.confirm
+        await self.sender.reply_text(update.message, confirmation_text, reply_markup=reply_markup)
         return CONFIRM_BOOKING
 
     async def send_admin_notification(self, user_id: int, user_name: str, booking_data: dict):
@@ -367,24 +316,22 @@ class CarWashBot:
             logger.warning("ADMIN_USER_ID не установлен, уведомление не отправлено")
             return
         try:
-            date_obj = datetime.strptime(booking_data['booking_date'], '%Y-%m-%d').date()
-            date_formatted = date_obj.strftime('%d.%m.%Y')
-            day_name = self.get_day_name(date_obj.weekday())
+            day = DATE_TABLE.get(booking_data['booking_date'])
 
             notification_text = (
                 f"📢 <b>Новая запись на автомойку!</b>\n\n"
-                f"👤 <b>Клиент:</b> {user_name}\n"
+                f"👤 <b>Клиент:</b> {html.escape(user_name or '')}\n"
                 f"🆔 <b>ID:</b> {user_id}\n"
-                f"📞 <b>Телефон:</b> {booking_data['phone']}\n"
+                f"📞 <b>Телефон:</b> {html.escape(booking_data['phone'])}\n"
                 f"🚗 <b>Тип кузова:</b> {booking_data['car_body_name']}\n"
                 f"💧 <b>Тип мойки:</b> {booking_data['wash_type_name']}\n"
-                f"📅 <b>Дата:</b> {day_name}, {date_formatted}\n"
+                f"📅 <b>Дата:</b> {day.label}\n"
                 f"⏰ <b>Время:</b> {booking_data['booking_time']}\n"
             )
-            await app.bot.send_message(chat_id=ADMIN_USER_ID, text=notification_text, parse_mode='HTML')
-            logger.info(f"✅ Уведомление отправлено администратору о записи пользователя {user_id}")
+            await self.notifications.enqueue(ADMIN_USER_ID, notification_text, 'HTML')
+            logger.info(f"📨 Уведомление администратору о записи пользователя {user_id} поставлено в очередь")
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке уведомления администратору: {e}")
+            logger.error(f"❌ Ошибка при постановке уведомления администратору в очередь: {e}")
 
     async def send_admin_cancellation_notification(self, user_id: int, user_name: str, booking_data: dict):
         """Отправить уведомление администратору об отмене записи"""
@@ -392,24 +339,22 @@ class CarWashBot:
             logger.warning("ADMIN_USER_ID не установлен, уведомление об отмене не отправлено")
             return
         try:
-            date_obj = datetime.strptime(booking_data['booking_date'], '%Y-%m-%d').date()
-            date_formatted = date_obj.strftime('%d.%m.%Y')
-            day_name = self.get_day_name(date_obj.weekday())
+            day = DATE_TABLE.get(booking_data['booking_date'])
 
             notification_text = (
                 f"❌ <b>Отмена записи на автомойку!</b>\n\n"
-                f"👤 <b>Клиент:</b> {user_name}\n"
+                f"👤 <b>Клиент:</b> {html.escape(user_name or '')}\n"
                 f"🆔 <b>ID:</b> {user_id}\n"
-                f"📞 <b>Телефон:</b> {booking_data['phone']}\n"
+                f"📞 <b>Телефон:</b> {html.escape(booking_data['phone'])}\n"
                 f"🚗 <b>Тип кузова:</b> {booking_data['car_body_name']}\n"
                 f"💧 <b>Тип мойки:</b> {booking_data['wash_type_name']}\n"
-                f"📅 <b>Дата:</b> {day_name}, {date_formatted}\n"
+                f"📅 <b>Дата:</b> {day.label}\n"
                 f"⏰ <b>Время:</b> {booking_data['booking_time']}\n"
             )
-            await app.bot.send_message(chat_id=ADMIN_USER_ID, text=notification_text, parse_mode='HTML')
-            logger.info(f"✅ Уведомление об отмене отправлено администратору о пользователе {user_id}")
+            await self.notifications.enqueue(ADMIN_USER_ID, notification_text, 'HTML')
+            logger.info(f"📨 Уведомление администратору об отмене пользователя {user_id} поставлено в очередь")
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке уведомления об отмене администратору: {e}")
+            logger.error(f"❌ Ошибка при постановке уведомления об отмене в очередь: {e}")
 
     async def confirm_booking(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик подтверждения записи"""
@@ -417,10 +362,10 @@ class CarWashBot:
         await query.answer()
 
         if query.data == "confirm_no":
-            await query.edit_message_text("❌ Запись отменена.")
+            await self.sender.edit_query_message(query, "❌ Запись отменена.")
             return ConversationHandler.END
 
-        success = db.add_booking(
+        result = await self.db.book_slot(
             user_id=update.effective_user.id,
             booking_date=context.user_data['booking_date'],
             booking_time=context.user_data['booking_time'],
@@ -430,21 +375,24 @@ class CarWashBot:
             wash_type=context.user_data['wash_type']
         )
 
-        if success:
-            date_obj = datetime.strptime(context.user_data['booking_date'], '%Y-%m-%d').date()
-            date_formatted = date_obj.strftime('%d.%m.%Y')
-            day_name = self.get_day_name(date_obj.weekday())
+        if result is BookingResult.BOOKED:
+            self.expiry.add(
+                context.user_data['booking_date'],
+                context.user_data['booking_time'],
+                wash_duration(context.user_data['car_body_type'], context.user_data['wash_type'])
+            )
+            day = DATE_TABLE.get(context.user_data['booking_date'])
 
             success_text = (
                 f"🎉 Спасибо! Ваша запись подтверждена!\n\n"
                 f"🚗 Тип кузова: {context.user_data['car_body_name']}\n"
                 f"💧 Тип мойки: {context.user_data['wash_type_name']}\n"
-                f"📅 Дата: {day_name}, {date_formatted}\n"
+                f"📅 Дата: {day.label}\n"
                 f"⏰ Время: {context.user_data['booking_time']}\n"
                 f"📞 Телефон: {context.user_data['phone']}\n\n"
                 f"Мы ждем вас! 🚗✨"
             )
-            await query.edit_message_text(success_text)
+            await self.sender.edit_query_message(query, success_text)
 
             await self.send_admin_notification(
                 user_id=update.effective_user.id,
@@ -457,17 +405,20 @@ class CarWashBot:
                     'phone': context.user_data['phone']
                 }
             )
+        elif result is BookingResult.DUPLICATE:
+            await self.sender.edit_query_message(query, "ℹ️ У вас уже есть запись на это время. Посмотреть её можно в разделе «Мои записи» (/start).")
         else:
-            await query.edit_message_text("❌ Ошибка при создании записи. Это время уже занято. Пожалуйста, выберите другое время.")
+            await self.sender.edit_query_message(query, "❌ Ошибка при создании записи. Это время уже занято. Пожалуйста, выберите другое время.")
 
         return ConversationHandler.END
 
     async def show_my_bookings(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Показать записи пользователя"""
-        bookings = db.get_user_bookings(query.from_user.id)
+        bookings = await self.db.get_user_bookings(query.from_user.id)
 
         if not bookings:
-            await query.edit_message_text(
+            await self.sender.edit_query_message(
+                query,
                 "📋 У вас нет активных записей.\n\n"
                 "Нажмите /start для возврата в меню или /help для инструкции."
             )
@@ -477,9 +428,7 @@ class CarWashBot:
         keyboard = []
 
         for booking in bookings:
-            date_obj = datetime.strptime(booking['booking_date'], '%Y-%m-%d').date()
-            date_formatted = date_obj.strftime('%d.%m.%Y')
-            day_name = self.get_day_name(date_obj.weekday())
+            day = DATE_TABLE.get(booking['booking_date'])
             car_body_name = CAR_BODY_TYPES.get(booking['car_body_type'], 'Неизвестно')
             wash_type_name = WASH_TYPES.get(booking['wash_type'], 'Неизвестно')
 
@@ -487,7 +436,7 @@ class CarWashBot:
                 f"🆔 ID: {booking['id']}\n"
                 f"🚗 Тип кузова: {car_body_name}\n"
                 f"💧 Тип мойки: {wash_type_name}\n"
-                f"📅 Дата: {day_name}, {date_formatted}\n"
+                f"📅 Дата: {day.label}\n"
                 f"⏰ Время: {booking['booking_time']}\n"
                 f"📞 Телефон: {booking['phone']}\n"
                 f"{'─' * 40}\n"
@@ -498,7 +447,7 @@ class CarWashBot:
 
         keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")])
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(text, reply_markup=reply_markup)
+        await self.sender.edit_query_message(query, text, reply_markup=reply_markup)
         return SELECT_ACTION
 
     async def show_all_bookings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -506,44 +455,119 @@ class CarWashBot:
         user_id = update.effective_user.id
 
         if user_id != ADMIN_USER_ID:
-            await update.message.reply_text("❌ Доступ запрещён. Эта команда только для администратора.")
+            await self.sender.reply_text(update.message, "❌ Доступ запрещён. Эта команда только для администратора.")
             return ConversationHandler.END
 
-        bookings = db.get_all_bookings()
+        text, reply_markup = await self.render_admin_page()
+        await self.sender.reply_text(update.message, text, reply_markup=reply_markup, parse_mode='HTML')
+        return ConversationHandler.END
 
-        if not bookings:
-            await update.message.reply_text("📋 На данный момент нет активных записей.")
-            return ConversationHandler.END
+    async def show_metrics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать сводку метрик (только для администратора)"""
+        if update.effective_user.id != ADMIN_USER_ID:
+            await self.sender.reply_text(update.message, "❌ Доступ запрещён. Эта команда только для администратора.")
+            return
 
-        text = f"📊 <b>Все активные записи ({len(bookings)}):</b>\n\n"
+        summary = self.metrics.summary()
+        text = "📈 <b>Метрики</b> (p50 / p95, мс)\n\n<b>Обработчики:</b>\n"
+        for name, count, p50, p95 in summary['handlers']:
+            text += f"• <code>{name}</code>: {p50 * 1000:g} / {p95 * 1000:g} ({count})\n"
+        text += "\n<b>БД:</b>\n"
+        for name, count, p50, p95 in summary['db']:
+            text += f"• <code>{name}</code>: {p50 * 1000:g} / {p95 * 1000:g} ({count})\n"
+        text += "\n<b>Воронка записи:</b>\n"
+        for step, count, dropoff in summary['funnel']:
+            text += f"• {step}: {count} (−{dropoff:.0%})\n"
+        text += f"\n❗ Ошибок: {summary['errors']}"
+        await self.sender.reply_text(update.message, text, parse_mode='HTML')
+
+    async def admin_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик кнопок листания и фильтра по дню в /admin"""
+        query = update.callback_query
+        await query.answer()
 
-        for booking in bookings:
-            date_obj = datetime.strptime(booking['booking_date'], '%Y-%m-%d').date()
-            date_formatted = date_obj.strftime('%d.%m.%Y')
-            day_name = self.get_day_name(date_obj.weekday())
+        if query.from_user.id != ADMIN_USER_ID:
+            return
+
+        # adm|all, adm|day|<дата>, adm|next|<дата>|<время>|<id>|<день>, adm|prev|...
+        parts = query.data.split('|')
+        action = parts[1]
+        after = before = day_filter = None
+
+        if action == 'day':
+            day_filter = parts[2]
+        elif action in ('next', 'prev'):
+            key = (parts[2], parts[3], int(parts[4]))
+            day_filter = parts[5] or None
+            if action == 'next':
+                after = key
+            else:
+                before = key
+
+        text, reply_markup = await self.render_admin_page(after=after, before=before, day_filter=day_filter)
+        await self.sender.edit_query_message(query, text, reply_markup=reply_markup, parse_mode='HTML')
+
+    async def render_admin_page(self, after=None, before=None, day_filter=None):
+        """Собрать текст и клавиатуру одной страницы списка записей"""
+        page = await self.db.get_bookings_page(after=after, before=before, booking_date=day_filter)
+        counts = await self.db.get_booking_counts_by_date()
+
+        if day_filter:
+            total = dict(counts).get(day_filter, 0)
+            text = f"📊 <b>Активные записи на {DATE_TABLE.get(day_filter).label} ({total}):</b>\n\n"
+        else:
+            total = sum(count for _, count in counts)
+            text = f"📊 <b>Все активные записи ({total}):</b>\n\n"
+
+        if not page['bookings']:
+            text = "📋 На данный момент нет активных записей."
+
+        for booking in page['bookings']:
+            day = DATE_TABLE.get(booking['booking_date'])
             car_body_name = CAR_BODY_TYPES.get(booking['car_body_type'], 'Неизвестно')
             wash_type_name = WASH_TYPES.get(booking['wash_type'], 'Неизвестно')
-            user_name = booking.get('username', 'Неизвестно') or 'Неизвестно'
+            user_name = html.escape(booking.get('username', 'Неизвестно') or 'Неизвестно')
 
             text += (
                 f"🆔 <b>Запись #{booking['id']}</b>\n"
                 f"👤 <b>Клиент:</b> {user_name} (ID: {booking['user_id']})\n"
-                f"📞 <b>Телефон:</b> {booking['phone']}\n"
+                f"📞 <b>Телефон:</b> {html.escape(booking['phone'])}\n"
                 f"🚗 <b>Тип кузова:</b> {car_body_name}\n"
                 f"💧 <b>Тип мойки:</b> {wash_type_name}\n"
-                f"📅 <b>Дата:</b> {day_name}, {date_formatted}\n"
+                f"📅 <b>Дата:</b> {day.label}\n"
                 f"⏰ <b>Время:</b> {booking['booking_time']}\n"
                 f"{'─' * 40}\n"
             )
 
-        if len(text) > 4096:
-            parts = [text[i:i+4000] for i in range(0, len(text), 4000)]
-            for part in parts:
-                await update.message.reply_text(part, parse_mode='HTML')
-        else:
-            await update.message.reply_text(text, parse_mode='HTML')
+        keyboard = []
+        nav_row = []
+        if page['bookings']:
+            first, last = page['bookings'][0], page['bookings'][-1]
+            if page['has_prev']:
+                nav_row.append(InlineKeyboardButton(
+                    "⬅️ Назад",
+                    callback_data=f"adm|prev|{first['booking_date']}|{first['booking_time']}|{first['id']}|{day_filter or ''}"
+                ))
+            if page['has_next']:
+                nav_row.append(InlineKeyboardButton(
+                    "Вперёд ➡️",
+                    callback_data=f"adm|next|{last['booking_date']}|{last['booking_time']}|{last['id']}|{day_filter or ''}"
+                ))
+        if nav_row:
+            keyboard.append(nav_row)
+
+        day_buttons = [
+            InlineKeyboardButton(
+                f"{DATE_TABLE.get(date_str).day_name} {DATE_TABLE.get(date_str).display[:5]} ({count})",
+                callback_data=f"adm|day|{date_str}"
+            )
+            for date_str, count in counts[:ADMIN_DAY_BUTTONS]
+        ]
+        keyboard.extend(day_buttons[i:i + 3] for i in range(0, len(day_buttons), 3))
+        if day_filter:
+            keyboard.append([InlineKeyboardButton("📋 Все дни", callback_data="adm|all")])
 
-        return ConversationHandler.END
+        return text, InlineKeyboardMarkup(keyboard) if keyboard else None
 
     async def cancel_booking_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик отмены записи"""
@@ -555,11 +579,7 @@ class CarWashBot:
 
         booking_id = int(query.data.replace("cancel_booking_", ""))
 
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM bookings WHERE id = ? AND user_id = ?', (booking_id, query.from_user.id))
-        booking = cursor.fetchone()
-        conn.close()
+        booking = await self.db.get_booking(booking_id, query.from_user.id)
 
         if booking:
             await self.send_admin_cancellation_notification(
@@ -574,14 +594,22 @@ class CarWashBot:
                 }
             )
 
-        db.cancel_booking(booking_id, query.from_user.id)
-        await query.edit_message_text("✅ Запись отменена.")
+        await self.db.cancel_booking(booking_id, query.from_user.id)
+        await self.sender.edit_query_message(query, "✅ Запись отменена.")
         return ConversationHandler.END
 
-    @staticmethod
-    def get_day_name(weekday):
-        days = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-        return days[weekday]
+    async def warm_up(self):
+        """Прогреть кэши до первого обновления.
+
+        Таблица дат, занятость постов по дням и клавиатуры дат для каждой
+        услуги заполняются заранее, поэтому первые пользователи после
+        перезапуска не ждут холодных запросов к БД; заодно открывается
+        подключение потока БД.
+        """
+        started = time.perf_counter()
+        for car_body_type, wash_type in WASH_DURATIONS:
+            self.keyboards.dates(await self.db.get_available_dates(car_body_type, wash_type))
+        logger.info(f"🔥 Кэши прогреты за {(time.perf_counter() - started) * 1000:.1f} мс")
 
     @staticmethod
     def validate_phone(phone):
@@ -590,14 +618,58 @@ class CarWashBot:
         return re.match(pattern, phone) is not None
 
 
-def main():
-    """Главная функция"""
-    global app
-    bot = CarWashBot()
+def build_application(token=BOT_TOKEN, request=None, db_path=None):
+    """Собрать Application со всеми обработчиками.
+
+    request — необязательная замена HTTP-клиента Bot API (например,
+    stub_bot.StubRequest для локальных нагрузочных тестов),
+    db_path — путь к БД вместо DB_PATH.
+    """
+    metrics = Metrics(STATE_NAMES)
+    db = AsyncDatabase(Database(db_path), metrics=metrics)
+    sender = RateLimitedSender()
+
+    async def send_notification(chat_id, text, parse_mode):
+        await sender.send_message(chat_id, text, parse_mode=parse_mode)
+
+    notifications = NotificationQueue(db, send_notification)
+    expiry = ExpiryScheduler(db)
+    archive = ArchiveJob(db)
+    bot = CarWashBot(db, notifications, sender, expiry, metrics)
+    metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+    async def post_init(application):
+        await bot.warm_up()
+        await notifications.start()
+        await expiry.start()
+        await archive.start()
+        if metrics_server is not None:
+            await metrics_server.start()
+
+    async def post_stop(application):
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await archive.stop()
+        await expiry.stop()
+        await notifications.stop()
+
+    async def post_shutdown(application):
+        db.close()
 
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
-    app = application  # Сохраняем глобальную ссылку на приложение
+    builder = (
+        Application.builder()
+        .token(token)
+        .application_class(PerUserOrderedApplication, kwargs={'max_concurrency': UPDATE_CONCURRENCY})
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .persistence(SQLitePersistence(db))
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+    sender.bot = application.bot
 
     # Создаем ConversationHandler
     conv_handler = ConversationHandler(
@@ -629,25 +701,63 @@ def main():
         fallbacks=[
             CommandHandler('start', bot.start),
             CallbackQueryHandler(bot.cancel_booking_handler, pattern='^cancel_booking_|^back_to_menu')
-        ]
+        ],
+        # Незавершённая запись переживает перезапуск бота
+        name='booking',
+        persistent=True
     )
 
     application.add_handler(conv_handler)
     
     # === КОМАНДЫ ДЛЯ АДМИНИСТРАТОРА ===
     application.add_handler(CommandHandler('admin', bot.show_all_bookings))
+    application.add_handler(CallbackQueryHandler(bot.admin_page, pattern=r'^adm\|'))
+    application.add_handler(CommandHandler('metrics', bot.show_metrics))
     application.add_handler(CommandHandler('help', bot.help_command))
     # ========================================
 
-    # Запускаем бота
-    logger.info("🚗 Бот запущен и готов к работе!")
+    # Замер времени всех обработчиков и мгновенные значения очередей и кэшей
+    metrics.instrument_application(application)
+    metrics.add_collector('notifications', notifications.stats)
+    metrics.add_collector('sender', sender.stats)
+    metrics.add_collector('availability_cache', db.availability.stats)
+    metrics.add_collector('known_users', db.known_users.stats)
+
+    return application
+
+
+def configure_logging():
+    """Настроить логирование процесса бота (не при импорте модуля)"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
 
-    async def cleanup_old_bookings(context):
-        db.remove_expired_bookings()
 
-    # Запуск проверки каждые 60 минут
-        application.job_queue.run_repeating(cleanup_old_bookings, interval=3600, first=10)
-    application.run_polling()
+def main():
+    """Главная функция"""
+    configure_logging()
+    application = build_application()
+
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            logger.error("❌ Для режима webhook нужно задать WEBHOOK_URL и WEBHOOK_SECRET")
+            # Ненулевой код: systemd и run.sh должны видеть ошибку настройки, а не штатную остановку
+            raise SystemExit(1)
+
+        # Запускаем бота: Telegram сам присылает обновления на наш HTTP-сервер
+        logger.info(f"🚗 Бот запущен в режиме webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        # Запускаем бота
+        logger.info("🚗 Бот запущен и готов к работе!")
+        application.run_polling()
 
 
 if __name__ == '__main__':
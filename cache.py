@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import AVAILABILITY_CACHE_TTL, KNOWN_USERS_CACHE_SIZE
+
+
+class AvailabilityCache:
+    """Кэш занятости в памяти: дата -> schedule.DaySchedule.
+
+    Свободные времена для конкретной длительности мойки считаются по
+    кэшированному индексу дня при чтении. Записи сбрасываются при изменении
+    брони (add/cancel/expire) и по TTL, чтобы изменения, сделанные в обход
+    бота, тоже со временем подхватывались.
+    Отсечение прошедших слотов сегодняшнего дня делается при чтении.
+    """
+
+    def __init__(self, ttl=AVAILABILITY_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def get(self, date_str):
+        """Получить занятость дня или None, если дня нет в кэше"""
+        with self._lock:
+            entry = self._days.get(date_str)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, date_str, schedule, version):
+        """Сохранить занятость дня.
+
+        version — значение self.version на момент чтения из БД: если с тех пор
+        кэш сбрасывался, данные могли устареть и не сохраняются.
+        """
+        with self._lock:
+            if version != self.version:
+                return
+            self._days[date_str] = (time.monotonic() + self.ttl, schedule)
+
+    def invalidate(self, date_str=None):
+        """Сбросить кэш одного дня или весь кэш"""
+        with self._lock:
+            if date_str is None:
+                self._days.clear()
+            else:
+                self._days.pop(date_str, None)
+            self.version += 1
+
+    def stats(self):
+        """Счётчики попаданий и промахов"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._days), 'version': self.version}
+
+
+class KnownUsersCache:
+    """LRU уже записанных в БД пользователей: user_id -> (username, first_name).
+
+    Позволяет не писать в БД на каждый /start, если данные пользователя
+    не изменились. Хранит не больше maxsize пользователей.
+    """
+
+    def __init__(self, maxsize=KNOWN_USERS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_known(self, user_id, username, first_name):
+        """Проверить, что пользователь уже записан в БД с такими же данными"""
+        with self._lock:
+            if self._users.get(user_id) == (username, first_name):
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def remember(self, user_id, username, first_name):
+        """Запомнить данные пользователя, записанные в БД"""
+        with self._lock:
+            self._users[user_id] = (username, first_name)
+            self._users.move_to_end(user_id)
+            if len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def stats(self):
+        """Счётчики попаданий и промахов"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._users)}
@@ -9,9 +9,83 @@ BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 # Admin User ID для получения уведомлений
 ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', '0'))
 
+# Режим получения обновлений: 'polling' или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Настройки webhook: публичный URL, адрес локального HTTP-сервера и секрет,
+# который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Сколько обновлений обрабатывать параллельно (обновления одного пользователя — всегда по порядку).
+# 1 — строго последовательная обработка
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '64'))
+
+# Локальный эндпоинт метрик в формате Prometheus (0 — не запускать)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
 # Database settings
 DB_PATH = 'carwash_bot.db'
 
+# Количество потоков для запросов к БД и лимит ожидающих запросов
+DB_WORKERS = 4
+DB_QUEUE_SIZE = 100
+
+# Повторы бронирования при занятой БД (SQLITE_BUSY) и начальная пауза в секундах
+BOOKING_RETRIES = 5
+BOOKING_RETRY_DELAY = 0.05
+
+# Очередь уведомлений администратору: воркеры, попытки, пауза между повторами (с)
+NOTIFY_WORKERS = 2
+NOTIFY_MAX_ATTEMPTS = 8
+NOTIFY_RETRY_DELAY = 2
+NOTIFY_MAX_RETRY_DELAY = 300
+
+# Лимиты Telegram: сообщений в секунду всего и на один чат, запас для всплесков на чат
+SEND_GLOBAL_RATE = 30
+SEND_CHAT_RATE = 1
+SEND_CHAT_BURST = 3
+SEND_MAX_RETRIES = 3
+
+# Сколько записей завершать одной транзакцией, когда слот закончился
+EXPIRY_BATCH_SIZE = 100
+# Раз в столько секунд расписание завершения сверяется с БД: подхватываются записи,
+# добавленные в обход бота (examples.py, ручной SQL, другой процесс)
+EXPIRY_RESYNC_INTERVAL = int(os.getenv('EXPIRY_RESYNC_INTERVAL', '300'))
+
+# Архивация: неактивные записи старше стольких дней переносятся в bookings_archive
+# пачками по ARCHIVE_BATCH_SIZE, проверка — раз в ARCHIVE_INTERVAL секунд
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_INTERVAL = 3600
+# Первая архивация — через столько секунд после запуска, а не вместе с первыми обновлениями
+ARCHIVE_START_DELAY = 60
+
+# Сколько строк заполнять в одной транзакции при миграциях схемы (см. migrations.py)
+MIGRATION_BATCH_SIZE = 1000
+
+# Как часто (с) сбрасывать накопленные изменения диалогов в БД
+PERSISTENCE_FLUSH_INTERVAL = 5
+
+# Трассировка SQL: замер каждого запроса, журнал медленных запросов и агрегаты
+SQL_TRACE = os.getenv('SQL_TRACE', '') == '1'
+SQL_SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS', '50'))
+SQL_SLOW_LOG = os.getenv('SQL_SLOW_LOG', '')  # файл журнала; пусто — только в общий лог
+
+# Параметры SQLite для каждого подключения
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',       # читатели не блокируют писателя
+    'synchronous': 'NORMAL',     # в WAL-режиме безопасно и без fsync на каждый коммит
+    'busy_timeout': 5000,        # мс ожидания блокировки вместо мгновенной ошибки
+    'cache_size': -16000,        # 16 МБ кэша страниц на подключение
+    'mmap_size': 268435456,      # 256 МБ memory-mapped I/O
+    'temp_store': 'MEMORY',
+}
+
 # Время работы автомойки (в часах)
 WORKING_HOURS = {
     'start': 9,      # 9:00
@@ -22,8 +96,23 @@ WORKING_HOURS = {
 # Количество дней вперед, на которые можно записаться
 DAYS_AHEAD = 7
 
-# Максимальное количество записей на один слот времени
-MAX_BOOKINGS_PER_SLOT = 2
+# Количество постов мойки: столько машин моется одновременно
+WASH_BAYS = 2
+
+# Максимальное количество записей на один слот времени (мойки длиной в слот)
+MAX_BOOKINGS_PER_SLOT = WASH_BAYS
+
+# Количество записей на одной странице /admin
+ADMIN_PAGE_SIZE = 10
+
+# Сколько ближайших дней показывать кнопками фильтра в /admin
+ADMIN_DAY_BUTTONS = 9
+
+# Сколько секунд кэш свободных мест считается актуальным
+AVAILABILITY_CACHE_TTL = 60
+
+# Сколько пользователей помнить, чтобы не перезаписывать их на каждый /start
+KNOWN_USERS_CACHE_SIZE = 10000
 
 # Типы кузова
 CAR_BODY_TYPES = {
@@ -39,3 +128,18 @@ WASH_TYPES = {
     'single': 'Однофазная мойка',
     'double': 'Двухфазная мойка'
 }
+
+# Длительность мойки в минутах по типу кузова и типу мойки.
+# Записи без типа (старые, созданные в обход бота) занимают один слот.
+WASH_DURATIONS = {
+    ('sedan', 'single'): 60,
+    ('sedan', 'double'): 90,
+    ('hatchback', 'single'): 60,
+    ('hatchback', 'double'): 90,
+    ('suv', 'single'): 90,
+    ('suv', 'double'): 120,
+    ('van', 'single'): 90,
+    ('van', 'double'): 120,
+    ('truck', 'single'): 120,
+    ('truck', 'double'): 180,
+}
@@ -1,71 +1,186 @@
+import asyncio
+import functools
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from config import DB_PATH, MAX_BOOKINGS_PER_SLOT, DAYS_AHEAD, WORKING_HOURS
+from enum import Enum
+from cache import AvailabilityCache, KnownUsersCache
+from migrations import BOOKING_COLUMNS, migrate
+from schedule import DaySchedule
+from sqltrace import SqlTracer, TracingCursor
+from timetable import DATE_TABLE, SLOT_MINUTES, to_minutes, wash_duration
+from config import (
+    DB_PATH, ADMIN_PAGE_SIZE,
+    DB_WORKERS, DB_QUEUE_SIZE, DB_PRAGMAS, BOOKING_RETRIES, BOOKING_RETRY_DELAY,
+    EXPIRY_BATCH_SIZE, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, SQL_TRACE
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Подключение из пула: close() возвращает его в пул, а не закрывает.
+
+    Если задан tracer (sqltrace.SqlTracer), курсоры подключения замеряют
+    каждый запрос. Connection.execute() и executemany() создают курсор в C
+    в обход cursor(), поэтому при трассировке они переопределены и идут
+    через него.
+    """
+
+    tracer = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = TracingCursor if self.tracer is not None else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if self.tracer is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.tracer is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        if self.tracer is None:
+            return super().executescript(sql_script)
+        return self.cursor().executescript(sql_script)
+
+    def close(self):
+        # Как и при настоящем закрытии, незакоммиченные изменения теряются
+        if self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        """Действительно закрыть подключение"""
+        super().close()
+
+
+class ConnectionPool:
+    """Пул подключений к SQLite: одно постоянное подключение на поток.
+
+    Подключения открываются в режиме WAL, поэтому читатели работают
+    параллельно с единственным писателем.
+    """
+
+    def __init__(self, db_path, pragmas=None, tracer=None):
+        self.db_path = db_path
+        self.pragmas = DB_PRAGMAS if pragmas is None else pragmas
+        self.tracer = tracer
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Получить подключение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        # check_same_thread=False нужен только для закрытия из другого потока
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.tracer = self.tracer
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        """Закрыть все подключения пула"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.release()
+        self._local = threading.local()
+
+
+class BookingResult(Enum):
+    """Результат попытки бронирования"""
+    BOOKED = 'booked'          # запись создана
+    SLOT_FULL = 'slot_full'    # в слоте не осталось мест
+    DUPLICATE = 'duplicate'    # у пользователя уже есть запись на этот слот
+
+
+def is_busy_error(error):
+    """Ошибка SQLite из-за занятой блокировки (SQLITE_BUSY / SQLITE_LOCKED)"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
 
 
 class Database:
-    def __init__(self):
-        self.db_path = DB_PATH
+    def __init__(self, db_path=None, trace=SQL_TRACE):
+        """trace — замерять каждый SQL-запрос (см. sqltrace.py)"""
+        self.db_path = db_path or DB_PATH
+        self.tracer = SqlTracer() if trace else None
+        self.pool = ConnectionPool(self.db_path, tracer=self.tracer)
+        self.availability = AvailabilityCache()
+        self.known_users = KnownUsersCache()
         self.init_db()
 
     def get_connection(self):
-        """Получить подключение к БД"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Получить подключение к БД из пула (close() возвращает его в пул)"""
+        return self.pool.get()
 
-    def init_db(self):
-        """Инициализировать базу данных"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def close(self):
+        """Закрыть все подключения к БД (и записать SQL-статистику, если включена трассировка)"""
+        self.pool.close_all()
+        if self.tracer is not None:
+            self.tracer.dump()
 
-        # Таблица пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                phone TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    def sql_stats(self):
+        """Агрегаты трассировки по SQL-запросам (пусто, если трассировка выключена)"""
+        return self.tracer.stats() if self.tracer is not None else []
 
-        # Таблица записей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                booking_date DATE NOT NULL,
-                booking_time TEXT NOT NULL,
-                service TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                car_body_type TEXT,
-                wash_type TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                UNIQUE(booking_date, booking_time, user_id)
-            )
-        ''')
+    def init_db(self):
+        """Привести схему БД к текущей версии (см. migrations.py).
 
-        conn.commit()
-        conn.close()
+        На актуальной БД это одно чтение PRAGMA user_version.
+        """
+        conn = self.get_connection()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
 
     def add_user(self, user_id, username, first_name):
-        """Добавить или обновить пользователя"""
+        """Добавить пользователя или обновить его имя.
+
+        Пишет в БД, только если username или first_name изменились; телефон
+        и дата регистрации сохраняются. Возвращает True, если была запись.
+        """
+        if self.known_users.is_known(user_id, username, first_name):
+            return False
+
         conn = self.get_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
-            INSERT OR REPLACE INTO users (user_id, username, first_name)
+            INSERT INTO users (user_id, username, first_name)
             VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                username = excluded.username,
+                first_name = excluded.first_name
+            WHERE username IS NOT excluded.username OR first_name IS NOT excluded.first_name
         ''', (user_id, username, first_name))
 
+        written = cursor.rowcount > 0
         conn.commit()
         conn.close()
+        self.known_users.remember(user_id, username, first_name)
+        return written
 
     def get_all_bookings(self):
-        """Получить только активные (будущие) записи"""
+        """Получить активные записи (прошедшие завершает ExpiryScheduler)"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
@@ -74,10 +189,6 @@ class Database:
             FROM bookings b
             LEFT JOIN users u ON b.user_id = u.user_id
             WHERE b.status = 'active'
-            AND (
-                b.booking_date > date('now') 
-                OR (b.booking_date = date('now') AND b.booking_time > time('now'))
-            )
             ORDER BY b.booking_date, b.booking_time
         ''')
 
@@ -86,6 +197,67 @@ class Database:
         conn.close()
         return bookings
 
+    def get_bookings_page(self, after=None, before=None, booking_date=None, limit=ADMIN_PAGE_SIZE):
+        """Получить страницу активных записей.
+
+        Keyset-пагинация по ключу (booking_date, booking_time, id): after —
+        ключ последней записи предыдущей страницы, before — ключ первой записи
+        следующей. booking_date ограничивает выборку одним днём.
+        Возвращает {'bookings': [...], 'has_prev': bool, 'has_next': bool}.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        conditions = ["b.status = 'active'"]
+        params = []
+        if booking_date is not None:
+            conditions.append('b.booking_date = ?')
+            params.append(booking_date)
+        # Отдельное условие по дате позволяет начать поиск по индексу сразу с ключа
+        if after is not None:
+            conditions.append('b.booking_date >= ? AND (b.booking_date, b.booking_time, b.id) > (?, ?, ?)')
+            params.extend((after[0], *after))
+        if before is not None:
+            conditions.append('b.booking_date <= ? AND (b.booking_date, b.booking_time, b.id) < (?, ?, ?)')
+            params.extend((before[0], *before))
+
+        # Назад листаем в обратном порядке и разворачиваем результат
+        order = 'DESC' if before is not None else 'ASC'
+        cursor.execute(f'''
+            SELECT b.*, u.username, u.first_name
+            FROM bookings b
+            LEFT JOIN users u ON b.user_id = u.user_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY b.booking_date {order}, b.booking_time {order}, b.id {order}
+            LIMIT ?
+        ''', (*params, limit + 1))
+
+        bookings = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        has_more = len(bookings) > limit
+        bookings = bookings[:limit]
+        if before is not None:
+            bookings.reverse()
+            return {'bookings': bookings, 'has_prev': has_more, 'has_next': True}
+        return {'bookings': bookings, 'has_prev': after is not None, 'has_next': has_more}
+
+    def get_booking_counts_by_date(self):
+        """Количество активных записей по дням"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT booking_date, COUNT(*) as count FROM bookings
+            WHERE status = 'active'
+            GROUP BY booking_date
+            ORDER BY booking_date
+        ''')
+
+        counts = [(row['booking_date'], row['count']) for row in cursor.fetchall()]
+        conn.close()
+        return counts
+
     def update_user_phone(self, user_id, phone):
         """Обновить номер телефона пользователя"""
         conn = self.get_connection()
@@ -98,106 +270,136 @@ class Database:
         conn.commit()
         conn.close()
 
-    def get_available_dates(self):
-        """Получить список доступных дат"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        available_dates = []
-        today = datetime.now().date()
-        
-        # Изменено: начинаем с 0 (сегодня), а не с 1 (завтра)
-        for i in range(0, DAYS_AHEAD + 1):
-            date = today + timedelta(days=i)
-            
-            # Проверяем, есть ли свободные слоты в этот день
-            cursor.execute('''
-                SELECT COUNT(*) as count FROM bookings 
-                WHERE booking_date = ? AND status = 'active'
-            ''', (date.strftime('%Y-%m-%d'),))
-            
-            result = cursor.fetchone()
-            booked_slots = result['count']
-            
-            # Всего слотов в день: 10 (с 9:00 до 19:00)
-            if booked_slots < 10:
-                available_dates.append(date)
-        
-        conn.close()
-        return available_dates
-
-    def get_available_times(self, date_str):
-        """Получить доступное время для конкретной даты"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        available_times = []
-        
-        # Генерируем все возможные времена с интервалом из конфига
-        start_hour = WORKING_HOURS['start']
-        end_hour = WORKING_HOURS['end']
-        interval = WORKING_HOURS['interval']
-        
-        current_time = start_hour * 60  # Переводим в минуты
-        end_time = end_hour * 60
-        
-        # ✅ Получаем текущую дату и время для проверки
-        today = datetime.now().date()
-        current_datetime = datetime.now()
-        
-        # ✅ Проверяем, является ли дата сегодняшней
-        is_today = (date_str == today.strftime('%Y-%m-%d'))
-        
-        while current_time < end_time:
-            hours = current_time // 60
-            minutes = current_time % 60
-            time_str = f"{hours:02d}:{minutes:02d}"
-            
-            # ✅ Если сегодня, пропускаем прошедшее время
-            if is_today:
-                slot_datetime = current_datetime.replace(hour=hours, minute=minutes, second=0, microsecond=0)
-                if slot_datetime <= current_datetime:
-                    current_time += int(interval * 60)
-                    continue
-            
-            # Проверяем, сколько записей на это время
+    def get_available_dates(self, car_body_type=None, wash_type=None):
+        """Получить список дат, на которые помещается мойка выбранного типа"""
+        days = DATE_TABLE.days()
+        schedules = self.get_day_schedules([day.iso for day in days])
+        duration = wash_duration(car_body_type, wash_type)
+
+        # День доступен, если в нём есть хотя бы одно ещё не прошедшее время начала
+        return [day.date for day in days if self._open_slots(day.iso, schedules[day.iso], duration)]
+
+    def get_available_times(self, date_str, car_body_type=None, wash_type=None):
+        """Получить времена начала, в которые помещается мойка выбранного типа"""
+        schedule = self.get_day_schedules([date_str])[date_str]
+        return self._open_slots(date_str, schedule, wash_duration(car_body_type, wash_type))
+
+    def get_day_schedules(self, dates):
+        """Получить занятость постов (schedule.DaySchedule) для каждой даты из списка.
+
+        Дни, которых нет в кэше, загружаются одним запросом по диапазону дат
+        (только из индекса активных записей). Возвращает {дата: DaySchedule}.
+        """
+        result = {}
+        missing = []
+        for date_str in dates:
+            schedule = self.availability.get(date_str)
+            if schedule is None:
+                missing.append(date_str)
+            else:
+                result[date_str] = schedule
+
+        if missing:
+            version = self.availability.version
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
             cursor.execute('''
-                SELECT COUNT(*) as count FROM bookings 
-                WHERE booking_date = ? AND booking_time = ? AND status = 'active'
-            ''', (date_str, time_str))
-            
-            result = cursor.fetchone()
-            booked_count = result['count']
-            
-            # Если есть свободные места
-            if booked_count < MAX_BOOKINGS_PER_SLOT:
-                available_times.append({
-                    'time': time_str,
-                    'available': MAX_BOOKINGS_PER_SLOT - booked_count
-                })
-            
-            current_time += int(interval * 60)  # Добавляем интервал в минутах
-        
-        conn.close()
-        return available_times
+                SELECT booking_date, booking_time, duration FROM bookings
+                WHERE status = 'active' AND booking_date BETWEEN ? AND ?
+            ''', (min(missing), max(missing)))
+
+            intervals = {}
+            for row in cursor.fetchall():
+                intervals.setdefault(row['booking_date'], []).append(
+                    self._interval(row['booking_time'], row['duration'])
+                )
+            conn.close()
+
+            for date_str in missing:
+                schedule = DaySchedule(intervals.get(date_str, ()))
+                self.availability.put(date_str, schedule, version)
+                result[date_str] = schedule
+
+        return result
+
+    @staticmethod
+    def _interval(booking_time, duration):
+        """Отрезок [начало, конец) записи в минутах от начала суток"""
+        start = to_minutes(booking_time)
+        return start, start + (duration or SLOT_MINUTES)
+
+    @staticmethod
+    def _open_slots(date_str, schedule, duration):
+        """Времена начала со свободным постом на всю мойку, без уже прошедшего времени сегодня"""
+        after = None
+        if date_str == DATE_TABLE.today.iso:
+            now = datetime.now()
+            after = now.hour * 60 + now.minute
+
+        return [{'time': slot.time, 'available': free} for slot, free in schedule.open_starts(duration, after)]
 
     def add_booking(self, user_id, booking_date, booking_time, service, phone, car_body_type=None, wash_type=None):
         """Добавить новую запись"""
+        result = self.book_slot(user_id, booking_date, booking_time, service, phone, car_body_type, wash_type)
+        return result is BookingResult.BOOKED
+
+    def book_slot(self, user_id, booking_date, booking_time, service, phone, car_body_type=None, wash_type=None):
+        """Атомарно забронировать мойку с проверкой свободного поста.
+
+        Записи дня читаются и проверяются на пересечение с новой мойкой
+        (длительность — по типу кузова и мойки) в одной транзакции
+        BEGIN IMMEDIATE, поэтому два одновременных подтверждения не могут
+        занять больше постов, чем есть. При SQLITE_BUSY попытка повторяется
+        с растущей паузой. Возвращает BookingResult.
+        """
+        duration = wash_duration(car_body_type, wash_type)
+        start = to_minutes(booking_time)
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        try:
-            cursor.execute('''
-                INSERT INTO bookings (user_id, booking_date, booking_time, service, phone, car_body_type, wash_type)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, booking_date, booking_time, service, phone, car_body_type, wash_type))
+        for attempt in range(BOOKING_RETRIES):
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('''
+                    SELECT user_id, booking_time, duration FROM bookings
+                    WHERE booking_date = ? AND status = 'active'
+                ''', (booking_date,))
+                rows = cursor.fetchall()
 
-            conn.commit()
-            conn.close()
-            return True
-        except sqlite3.IntegrityError:
-            conn.close()
-            return False
+                if any(row['user_id'] == user_id and row['booking_time'] == booking_time for row in rows):
+                    conn.rollback()
+                    return BookingResult.DUPLICATE
+                schedule = DaySchedule(self._interval(row['booking_time'], row['duration']) for row in rows)
+                if not schedule.fits(start, duration):
+                    conn.rollback()
+                    return BookingResult.SLOT_FULL
+
+                # Отменённая ранее запись на этот же слот занимает UNIQUE-ключ — переиспользуем её
+                cursor.execute('''
+                    INSERT INTO bookings (user_id, booking_date, booking_time, service, phone, car_body_type, wash_type, duration)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(booking_date, booking_time, user_id) DO UPDATE SET
+                        service = excluded.service,
+                        phone = excluded.phone,
+                        car_body_type = excluded.car_body_type,
+                        wash_type = excluded.wash_type,
+                        duration = excluded.duration,
+                        status = 'active',
+                        created_at = CURRENT_TIMESTAMP
+                ''', (user_id, booking_date, booking_time, service, phone, car_body_type, wash_type, duration))
+
+                conn.commit()
+                self.availability.invalidate(booking_date)
+                return BookingResult.BOOKED
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                if not is_busy_error(e) or attempt == BOOKING_RETRIES - 1:
+                    raise
+                time.sleep(BOOKING_RETRY_DELAY * 2 ** attempt)
+            finally:
+                conn.close()
 
     def get_user_bookings(self, user_id):
         """Получить все записи пользователя"""
@@ -208,7 +410,6 @@ class Database:
             SELECT * FROM bookings 
             WHERE user_id = ? 
             AND status = 'active'
-            AND (booking_date > date('now') OR (booking_date = date('now') AND booking_time > time('now')))
             ORDER BY booking_date, booking_time
         ''', (user_id,))
 
@@ -216,6 +417,17 @@ class Database:
         conn.close()
         return bookings
 
+    def get_booking(self, booking_id, user_id):
+        """Получить запись пользователя по ID"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM bookings WHERE id = ? AND user_id = ?', (booking_id, user_id))
+
+        booking = cursor.fetchone()
+        conn.close()
+        return booking
+
     def cancel_booking(self, booking_id, user_id):
         """Отменить запись"""
         conn = self.get_connection()
@@ -224,23 +436,276 @@ class Database:
         cursor.execute('''
             UPDATE bookings SET status = 'cancelled' 
             WHERE id = ? AND user_id = ?
+            RETURNING booking_date
         ''', (booking_id, user_id))
 
+        cancelled = cursor.fetchone()
         conn.commit()
         conn.close()
 
-    def remove_expired_bookings(self):
-        """Перевести прошедшие записи в статус completed"""
+        if cancelled:
+            self.availability.invalidate(cancelled['booking_date'])
+
+    def add_notification(self, chat_id, text, parse_mode=None):
+        """Сохранить уведомление в очередь отправки, вернуть его ID"""
         conn = self.get_connection()
         cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO outbox (chat_id, text, parse_mode) VALUES (?, ?, ?)
+        ''', (chat_id, text, parse_mode))
+
+        notification_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return notification_id
+
+    def get_pending_notifications(self):
+        """Получить все неотправленные уведомления в порядке добавления"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM outbox ORDER BY id')
+
+        notifications = cursor.fetchall()
+        conn.close()
+        return notifications
+
+    def record_notification_attempt(self, notification_id):
+        """Увеличить счётчик попыток отправки уведомления"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('UPDATE outbox SET attempts = attempts + 1 WHERE id = ?', (notification_id,))
+
+        conn.commit()
+        conn.close()
+
+    def delete_notification(self, notification_id):
+        """Удалить уведомление из очереди (отправлено или больше не будет отправляться)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('DELETE FROM outbox WHERE id = ?', (notification_id,))
+
+        conn.commit()
+        conn.close()
+
+    def load_conversation_data(self, user_id):
+        """Загрузить сохранённые user_data и состояния диалогов пользователя.
+
+        Возвращает (data, states): data — JSON user_data или None,
+        states — список строк (name, conversation_key, state) в JSON.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT data FROM conversation_user_data WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        cursor.execute('''
+            SELECT name, conversation_key, state FROM conversation_states WHERE user_id = ?
+        ''', (user_id,))
+        states = cursor.fetchall()
+
+        conn.close()
+        return (row['data'] if row else None), states
+
+    def save_conversation_data(self, user_data, states):
+        """Записать накопленные изменения диалогов одной транзакцией.
+
+        user_data — {user_id: JSON или None (удалить)},
+        states — {(name, conversation_key): (user_id, JSON-состояние или None)}.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany('''
+            INSERT INTO conversation_user_data (user_id, data) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+        ''', [(user_id, data) for user_id, data in user_data.items() if data is not None])
+        cursor.executemany('DELETE FROM conversation_user_data WHERE user_id = ?',
+                           [(user_id,) for user_id, data in user_data.items() if data is None])
+
+        cursor.executemany('''
+            INSERT INTO conversation_states (name, conversation_key, user_id, state) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name, conversation_key) DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+        ''', [(name, key, user_id, state) for (name, key), (user_id, state) in states.items() if state is not None])
+        cursor.executemany('DELETE FROM conversation_states WHERE name = ? AND conversation_key = ?',
+                           [key for key, (user_id, state) in states.items() if state is None])
+
+        conn.commit()
+        conn.close()
+
+    def get_active_slots(self):
+        """(дата, время начала, длительность) для всех активных записей без повторов"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT DISTINCT booking_date, booking_time, COALESCE(duration, ?) AS duration FROM bookings
+            WHERE status = 'active'
+        ''', (SLOT_MINUTES,))
+
+        slots = [(row['booking_date'], row['booking_time'], row['duration']) for row in cursor.fetchall()]
+        conn.close()
+        return slots
+
+    def expire_slot(self, booking_date, booking_time, batch_size=EXPIRY_BATCH_SIZE, duration=None):
+        """Перевести активные записи, начавшиеся в booking_date booking_time, в статус completed.
+
+        duration — завершить только записи не длиннее duration минут: более
+        длинные мойки с тем же началом ещё идут. Записи обновляются пачками
+        по batch_size в отдельных транзакциях, чтобы не держать блокировку
+        записи долго. Возвращает число записей.
+        """
+        condition, params = '', ()
+        if duration is not None:
+            condition, params = 'AND COALESCE(duration, ?) <= ?', (SLOT_MINUTES, duration)
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        expired = 0
+        while True:
+            cursor.execute(f'''
+                UPDATE bookings SET status = 'completed'
+                WHERE id IN (
+                    SELECT id FROM bookings
+                    WHERE status = 'active' AND booking_date = ? AND booking_time = ? {condition}
+                    LIMIT ?
+                )
+            ''', (booking_date, booking_time, *params, batch_size))
+            conn.commit()
+            expired += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+        conn.close()
+
+        if expired:
+            self.availability.invalidate(booking_date)
+        return expired
+
+    def remove_expired_bookings(self, now=None):
+        """Перевести все записи, мойка по которым уже закончилась, в статус completed.
+
+        Нужна при запуске, чтобы догнать пропущенное, пока бот не работал;
+        дальше записи завершает ExpiryScheduler по одному слоту.
+        """
+        now = now or datetime.now()
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # Мойки не переходят через полночь: записи будущих дней отсекаются по индексу
         cursor.execute('''
             UPDATE bookings 
             SET status = 'completed' 
-            WHERE status = 'active' 
-            AND (
-                booking_date < date('now') 
-                OR (booking_date = date('now') AND booking_time < time('now'))
-            )
-        ''')
+            WHERE status = 'active'
+            AND booking_date <= ?
+            AND datetime(booking_date || ' ' || booking_time, '+' || COALESCE(duration, ?) || ' minutes') <= ?
+        ''', (now.strftime('%Y-%m-%d'), SLOT_MINUTES, now.strftime('%Y-%m-%d %H:%M:%S')))
+        expired = cursor.rowcount
         conn.commit()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+        if expired:
+            self.availability.invalidate()
+        return expired
+
+
+    def archive_bookings(self, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+        """Перенести неактивные записи старше older_than_days дней в bookings_archive.
+
+        Записи переносятся пачками по batch_size, каждая пачка — отдельная
+        короткая транзакция, чтобы не задерживать бронирования.
+        Возвращает число перенесённых записей.
+        """
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        archived = 0
+        try:
+            while True:
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('''
+                    SELECT id FROM bookings
+                    WHERE status != 'active' AND booking_date < ?
+                    LIMIT ?
+                ''', (cutoff, batch_size))
+                ids = [row['id'] for row in cursor.fetchall()]
+                if not ids:
+                    conn.rollback()
+                    break
+
+                placeholders = ', '.join('?' * len(ids))
+                cursor.execute(f'''
+                    INSERT INTO bookings_archive ({BOOKING_COLUMNS})
+                    SELECT {BOOKING_COLUMNS} FROM bookings WHERE id IN ({placeholders})
+                ''', ids)
+                cursor.execute(f'DELETE FROM bookings WHERE id IN ({placeholders})', ids)
+                conn.commit()
+
+                archived += len(ids)
+                if len(ids) < batch_size:
+                    break
+        finally:
+            conn.close()
+        return archived
+
+    def get_user_history(self, user_id, limit=20):
+        """Последние записи пользователя в любом статусе, включая архив"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT * FROM bookings_all
+            WHERE user_id = ?
+            ORDER BY booking_date DESC, booking_time DESC
+            LIMIT ?
+        ''', (user_id, limit))
+
+        history = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return history
+
+
+class AsyncDatabase:
+    """Асинхронная обёртка над Database.
+
+    Каждый вызов выполняется в отдельном пуле потоков БД, поэтому медленная
+    запись или ожидание блокировки SQLite не останавливает event loop.
+    Число одновременно ожидающих запросов ограничено DB_QUEUE_SIZE.
+    Методы повторяют Database: `await db.get_available_dates()` и т.д.
+    """
+
+    def __init__(self, database=None, workers=DB_WORKERS, queue_size=DB_QUEUE_SIZE, metrics=None):
+        """metrics — необязательный metrics.Metrics для замера времени методов"""
+        self.database = database or Database()
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db')
+        self._queue_slots = asyncio.Semaphore(queue_size)
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить синхронную функцию в потоке БД"""
+        async with self._queue_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.database, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        if self.metrics is not None:
+            attr = self.metrics.instrument_db(name, attr)
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        setattr(self, name, method)
+        return method
+
+    def close(self):
+        """Дождаться завершения запросов, остановить пул потоков и закрыть БД"""
+        self._executor.shutdown(wait=True)
+        self.database.close()
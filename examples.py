@@ -5,8 +5,15 @@
 from database import Database
 from datetime import datetime, timedelta
 
-# Инициализируем БД
-db = Database()
+_db = None
+
+
+def get_db():
+    """БД открывается при первом обращении, а не при импорте модуля"""
+    global _db
+    if _db is None:
+        _db = Database()
+    return _db
 
 # ============================================
 # ПРИМЕРЫ РАБОТЫ С ПОЛЬЗОВАТЕЛЯМИ
@@ -14,7 +21,7 @@ db = Database()
 
 def example_add_user():
     """Пример добавления пользователя"""
-    db.add_user(
+    get_db().add_user(
         user_id=123456789,
         username='john_doe',
         first_name='John'
@@ -24,7 +31,7 @@ def example_add_user():
 
 def example_update_phone():
     """Пример обновления номера телефона"""
-    db.update_user_phone(
+    get_db().update_user_phone(
         user_id=123456789,
         phone='+79991234567'
     )
@@ -37,7 +44,7 @@ def example_update_phone():
 
 def example_get_available_dates():
     """Пример получения доступных дат"""
-    dates = db.get_available_dates()
+    dates = get_db().get_available_dates()
     print(f"📅 Доступные даты ({len(dates)} шт):")
     for date in dates:
         print(f"  - {date.strftime('%d.%m.%Y (%A)')}")
@@ -46,7 +53,7 @@ def example_get_available_dates():
 def example_get_available_times():
     """Пример получения доступного времени"""
     date_str = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
-    times = db.get_available_times(date_str)
+    times = get_db().get_available_times(date_str)
     print(f"⏰ Доступное время на {date_str}:")
     for time_slot in times:
         print(f"  - {time_slot['time']} ({time_slot['available']} мест)")
@@ -60,7 +67,7 @@ def example_add_booking():
     """Пример добавления записи"""
     tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
     
-    success = db.add_booking(
+    success = get_db().add_booking(
         user_id=123456789,
         booking_date=tomorrow,
         booking_time='10:00',
@@ -76,7 +83,7 @@ def example_add_booking():
 
 def example_get_user_bookings():
     """Пр��мер получения записей пользователя"""
-    bookings = db.get_user_bookings(user_id=123456789)
+    bookings = get_db().get_user_bookings(user_id=123456789)
     print(f"📋 Записи пользователя ({len(bookings)} шт):")
     for booking in bookings:
         print(f"  - {booking['booking_date']} {booking['booking_time']}: {booking['service']}")
@@ -84,7 +91,7 @@ def example_get_user_bookings():
 
 def example_cancel_booking():
     """Пример отмены записи"""
-    db.cancel_booking(booking_id=1, user_id=123456789)
+    get_db().cancel_booking(booking_id=1, user_id=123456789)
     print("✅ Запись отменена")
 
 
@@ -94,7 +101,7 @@ def example_cancel_booking():
 
 def example_get_statistics():
     """Пример получения статистики"""
-    conn = db.get_connection()
+    conn = get_db().get_connection()
     cursor = conn.cursor()
     
     # Всего записей
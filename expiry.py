@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+
+from config import EXPIRY_RESYNC_INTERVAL
+from timetable import SLOT_MINUTES
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryScheduler:
+    """Завершение записей точно по окончании мойки.
+
+    Держит min-кучу времён окончания (начало + длительность мойки) активных
+    записей и спит до ближайшего из них. Когда мойка заканчивается, в статус
+    completed переводятся только записи с этим началом и длительностью
+    (Database.expire_slot), а не вся таблица.
+
+    Записи, добавленные в обход бота, подхватываются сверкой с БД раз в
+    resync_interval секунд (resync).
+    """
+
+    def __init__(self, db, slot_minutes=SLOT_MINUTES, resync_interval=EXPIRY_RESYNC_INTERVAL):
+        """db — AsyncDatabase, slot_minutes — длительность записи, если она не указана"""
+        self.db = db
+        self.slot_minutes = slot_minutes
+        self.resync_interval = resync_interval
+        self.expired = 0
+        self._heap = []
+        self._scheduled = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        """Завершить пропущенное, загрузить активные слоты и запустить планировщик"""
+        expired = await self.resync()
+        if expired:
+            logger.info(f"🧹 Завершено прошедших записей при запуске: {expired}")
+        self._task = asyncio.create_task(self._run())
+
+    async def resync(self, now=None):
+        """Сверить расписание с БД.
+
+        Завершает закончившиеся записи, которых нет в куче, и добавляет в
+        кучу активные слоты, записанные в обход add(). Возвращает число
+        завершённых записей.
+        """
+        expired = await self.db.remove_expired_bookings(now)
+        self.expired += expired
+
+        for booking_date, booking_time, duration in await self.db.get_active_slots():
+            self.add(booking_date, booking_time, duration)
+        return expired
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def add(self, booking_date, booking_time, duration=None):
+        """Запланировать завершение записей с этим началом и длительностью (повторы игнорируются)"""
+        duration = duration or self.slot_minutes
+        key = (booking_date, booking_time, duration)
+        if key in self._scheduled:
+            return
+        ends_at = datetime.strptime(f"{booking_date} {booking_time}", '%Y-%m-%d %H:%M') + timedelta(minutes=duration)
+        self._scheduled.add(key)
+        heapq.heappush(self._heap, (ends_at, booking_date, booking_time, duration))
+        # Новый слот заканчивается раньше, чем тот, до которого спит планировщик
+        if self._heap[0][0] == ends_at:
+            self._wakeup.set()
+
+    def next_expiry(self):
+        """Ближайшее время окончания мойки или None"""
+        return self._heap[0][0] if self._heap else None
+
+    async def expire_due(self, now=None):
+        """Завершить все мойки, которые уже закончились"""
+        now = now or datetime.now()
+        while self._heap and self._heap[0][0] <= now:
+            ends_at, booking_date, booking_time, duration = heapq.heappop(self._heap)
+            self._scheduled.discard((booking_date, booking_time, duration))
+            try:
+                self.expired += await self.db.expire_slot(booking_date, booking_time, duration=duration)
+            except Exception:
+                # Запись остаётся в расписании и будет завершена при следующей попытке
+                self.add(booking_date, booking_time, duration)
+                raise
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        resync_at = loop.time() + self.resync_interval
+        while True:
+            self._wakeup.clear()
+            delay = resync_at - loop.time()
+            ends_at = self.next_expiry()
+            if ends_at is not None:
+                delay = min(delay, (ends_at - datetime.now()).total_seconds())
+            timer = loop.call_later(max(delay, 0), self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
+
+            try:
+                if loop.time() >= resync_at:
+                    resync_at = loop.time() + self.resync_interval
+                    expired = await self.resync()
+                    if expired:
+                        logger.info(f"🧹 Завершено записей, добавленных в обход бота: {expired}")
+                await self.expire_due()
+            except Exception as e:
+                logger.error(f"❌ Ошибка при завершении записей: {e}")
+                await asyncio.sleep(1)
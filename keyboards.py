@@ -0,0 +1,81 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from config import CAR_BODY_TYPES, WASH_TYPES
+from timetable import DATE_TABLE
+
+# Сколько разных клавиатур дат/времени держать в кэше
+DYNAMIC_CACHE_SIZE = 64
+
+
+class Keyboards:
+    """Реестр inline-клавиатур бота.
+
+    Статические меню собираются один раз при создании реестра и
+    раздаются всем обработчикам как общие неизменяемые объекты
+    (InlineKeyboardMarkup в python-telegram-bot заморожены после создания).
+    Клавиатуры дат и времени кэшируются по набору свободных дат/слотов,
+    поэтому при неизменной доступности повторно не создаются.
+    """
+
+    def __init__(self):
+        self.start_menu = self._build([
+            [("📝 Записаться", "book_wash")],
+            [("📋 Мои записи", "my_bookings")],
+            [("❌ Отмена", "cancel")],
+        ])
+        self.help_menu = self._build([
+            [("📝 Записаться", "book_wash")],
+            [("📋 Мои записи", "my_bookings")],
+            [("🔙 Главное меню", "back_to_menu")],
+        ])
+        self.main_menu = self._build([
+            [("📝 Записаться", "book_wash")],
+            [("📋 Мои записи", "my_bookings")],
+            [("❓ Помощь", "help_info")],
+            [("❌ Отмена", "cancel")],
+        ])
+        self.car_body = self._build(
+            [[(body_name, f"body_{body_key}")] for body_key, body_name in CAR_BODY_TYPES.items()]
+            + [[("⬅️ Назад", "back_to_menu")]]
+        )
+        self.wash_type = self._build(
+            [[(wash_name, f"wash_{wash_key}")] for wash_key, wash_name in WASH_TYPES.items()]
+            + [[("⬅️ Назад", "back_to_body")]]
+        )
+        self.confirm = self._build([
+            [("✅ Подтвердить", "confirm_yes"), ("❌ Отменить", "confirm_no")],
+        ])
+        self._dates = {}
+        self._times = {}
+
+    @staticmethod
+    def _build(rows):
+        """Собрать клавиатуру из строк [(текст, callback_data), ...]"""
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton(text, callback_data=data) for text, data in row]
+            for row in rows
+        ])
+
+    @staticmethod
+    def _cached(cache, key, build):
+        markup = cache.get(key)
+        if markup is None:
+            if len(cache) >= DYNAMIC_CACHE_SIZE:
+                cache.clear()
+            markup = cache[key] = build()
+        return markup
+
+    def dates(self, available_dates):
+        """Клавиатура выбора даты для списка доступных дат"""
+        key = tuple(available_dates)
+        return self._cached(self._dates, key, lambda: self._build(
+            [[(DATE_TABLE.get(date).label, f"date_{DATE_TABLE.get(date).iso}")] for date in key]
+            + [[("⬅️ Назад", "back_to_wash")]]
+        ))
+
+    def times(self, available_times):
+        """Клавиатура выбора времени для списка свободных слотов"""
+        key = tuple((slot['time'], slot['available']) for slot in available_times)
+        return self._cached(self._times, key, lambda: self._build(
+            [[(f"⏰ {time_str} ({available} мест)", f"time_{time_str}")] for time_str, available in key]
+            + [[("⬅️ Назад", "back_to_dates")]]
+        ))
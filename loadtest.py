@@ -0,0 +1,281 @@
+"""
+Нагрузочный тест сценария записи.
+
+Поднимает бота целиком (build_application) с заглушкой Bot API и прогоняет
+N пользователей параллельно через весь диалог:
+/start → book_wash → body_ → wash_ → date_ → time_ → телефон → confirm_yes,
+а часть из них — ещё и через отмену: /start → my_bookings → cancel_booking_.
+
+Печатает JSON-отчёт: пропускная способность, p50/p95/p99 по каждому
+обработчику, исходы бронирования и ошибки (включая занятость SQLite),
+чтобы сравнивать изменения с базовым прогоном.
+
+Примеры:
+    python loadtest.py --users 200
+    python loadtest.py --users 500 --cancel 0.3 --latency 0.05 --output baseline.json
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from config import CAR_BODY_TYPES, WASH_TYPES
+
+# Сколько ждать обработки одного шага, прежде чем считать его потерянным
+STEP_TIMEOUT = 30
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+def user_payload(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+
+def message_update(bot, update_id, user_id, text):
+    """Update с текстовым сообщением (или командой) от пользователя"""
+    from telegram import Update
+
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': user_payload(user_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return Update.de_json({'update_id': update_id, 'message': message}, bot)
+
+
+def callback_update(bot, update_id, user_id, data):
+    """Update с нажатием inline-кнопки"""
+    from telegram import Update
+
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user_payload(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': 123456, 'is_bot': True, 'first_name': 'CarWash Stub'},
+                'text': '...',
+            },
+        },
+    }, bot)
+
+
+class LoadTest:
+    """Прогон синтетических пользователей через собранное приложение"""
+
+    def __init__(self, users, cancel_fraction, latency, telegram_limits, db_path):
+        from bot import build_application
+        from database import Database
+        from stub_bot import StubRequest, STUB_TOKEN
+
+        self.users = users
+        self.cancel_fraction = cancel_fraction
+        self.request = StubRequest(latency=latency)
+        self.application = build_application(token=STUB_TOKEN, request=self.request, db_path=db_path)
+        self.lookup = Database(db_path)
+        self.durations = defaultdict(list)
+        self.step_latencies = []
+        self.errors = Counter()
+        self.outcomes = Counter()
+        self._pending = {}
+        self._update_id = 0
+
+        bot = self._instrument()
+        if not telegram_limits:
+            # Лимиты Telegram растянули бы прогон на минуты и скрыли бы время обработчиков
+            bot.sender.chat_rate = bot.sender.chat_burst = 10 ** 6
+            bot.sender._global.rate = bot.sender._global.capacity = bot.sender._global.tokens = 10 ** 6
+
+    def _instrument(self):
+        """Обернуть колбэки обработчиков замером времени; вернуть экземпляр CarWashBot"""
+        from telegram.ext import ConversationHandler
+        from database import is_busy_error
+
+        handlers = []
+        for group in self.application.handlers.values():
+            for handler in group:
+                if isinstance(handler, ConversationHandler):
+                    handlers.extend(handler.entry_points + handler.fallbacks)
+                    for state_handlers in handler.states.values():
+                        handlers.extend(state_handlers)
+                else:
+                    handlers.append(handler)
+
+        bot = None
+        for handler in handlers:
+            callback = handler.callback
+            bot = getattr(inspect.unwrap(callback), '__self__', bot)
+
+            async def timed(update, context, callback=callback):
+                started = time.perf_counter()
+                try:
+                    return await callback(update, context)
+                except Exception as e:
+                    self.errors['db_busy' if is_busy_error(e) else type(e).__name__] += 1
+                    raise
+                finally:
+                    self.durations[callback.__name__].append(time.perf_counter() - started)
+                    future = self._pending.pop(update.effective_user.id, None)
+                    if future is not None and not future.done():
+                        future.set_result(None)
+
+            handler.callback = timed
+        return bot
+
+    def _message(self, user_id, text):
+        self._update_id += 1
+        return message_update(self.application.bot, self._update_id, user_id, text)
+
+    def _callback(self, user_id, data):
+        self._update_id += 1
+        return callback_update(self.application.bot, self._update_id, user_id, data)
+
+    async def step(self, user_id, update):
+        """Отправить обновление и дождаться, пока его обработает какой-нибудь обработчик"""
+        future = self._pending[user_id] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self.application.update_queue.put(update)
+        try:
+            await asyncio.wait_for(future, STEP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._pending.pop(user_id, None)
+            self.errors['step_timeout'] += 1
+            return False
+        self.step_latencies.append(time.perf_counter() - started)
+        return True
+
+    async def run_user(self, index):
+        from timetable import DATE_TABLE, SLOT_TIMES
+
+        user_id = 100000 + index
+        days = DATE_TABLE.days()[1:]
+        date_iso = days[index % len(days)].iso
+        time_str = SLOT_TIMES[(index // len(days)) % len(SLOT_TIMES)]
+        body = list(CAR_BODY_TYPES)[index % len(CAR_BODY_TYPES)]
+        wash = list(WASH_TYPES)[index % len(WASH_TYPES)]
+
+        booking_steps = [
+            self._message(user_id, '/start'),
+            self._callback(user_id, 'book_wash'),
+            self._callback(user_id, f'body_{body}'),
+            self._callback(user_id, f'wash_{wash}'),
+            self._callback(user_id, f'date_{date_iso}'),
+            self._callback(user_id, f'time_{time_str}'),
+            self._message(user_id, f'+7999{user_id:07d}'),
+            self._callback(user_id, 'confirm_yes'),
+        ]
+        for update in booking_steps:
+            if not await self.step(user_id, update):
+                self.outcomes['aborted'] += 1
+                return
+
+        bookings = await asyncio.to_thread(self.lookup.get_user_bookings, user_id)
+        if not bookings:
+            self.outcomes['slot_full'] += 1
+            return
+        self.outcomes['booked'] += 1
+
+        if index < self.users * self.cancel_fraction:
+            cancel_steps = [
+                self._message(user_id, '/start'),
+                self._callback(user_id, 'my_bookings'),
+                self._callback(user_id, f"cancel_booking_{bookings[0]['id']}"),
+            ]
+            for update in cancel_steps:
+                if not await self.step(user_id, update):
+                    self.outcomes['aborted'] += 1
+                    return
+            self.outcomes['cancelled'] += 1
+
+    async def run(self):
+        application = self.application
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        try:
+            started = time.perf_counter()
+            await asyncio.gather(*(self.run_user(index) for index in range(self.users)))
+            elapsed = time.perf_counter() - started
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+            self.lookup.close()
+
+        updates = len(self.step_latencies)
+        return {
+            'users': self.users,
+            'elapsed_s': round(elapsed, 3),
+            'updates': updates,
+            'updates_per_s': round(updates / elapsed, 1) if elapsed else 0.0,
+            'flows_per_s': round(self.users / elapsed, 1) if elapsed else 0.0,
+            'step_latency': latency_summary(self.step_latencies),
+            'handlers': {name: latency_summary(values) for name, values in sorted(self.durations.items())},
+            'outcomes': dict(self.outcomes),
+            'errors': dict(self.errors),
+            'bot_api_calls': dict(self.request.calls),
+        }
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as db_dir:
+        test = LoadTest(args.users, args.cancel, args.latency, args.telegram_limits, os.path.join(db_dir, 'loadtest.db'))
+        return await test.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест диалога записи')
+    parser.add_argument('--users', type=int, default=100, help='сколько пользователей проходят запись одновременно')
+    parser.add_argument('--cancel', type=float, default=0.2, help='доля пользователей, отменяющих запись')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа Bot API, с')
+    parser.add_argument('--telegram-limits', action='store_true', help='соблюдать лимиты Telegram на отправку')
+    parser.add_argument('--output', help='сохранить отчёт в JSON-файл')
+    parser.add_argument('--verbose', action='store_true', help='не глушить логи бота')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
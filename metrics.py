@@ -0,0 +1,272 @@
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами (как в Prometheus)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Оценка квантиля: верхняя граница корзины, в которую он попал"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Метрики бота: задержки обработчиков и методов БД, ошибки, переходы диалога.
+
+    Запись метрики — несколько арифметических операций под общей
+    блокировкой (методы БД выполняются в потоках), поэтому на горячем
+    пути она почти ничего не стоит. render() отдаёт всё в текстовом
+    формате Prometheus.
+    """
+
+    # Шаги воронки записи по порядку
+    FUNNEL = ('SELECT_CAR_BODY', 'SELECT_WASH_TYPE', 'SELECT_DATE', 'SELECT_TIME', 'ENTER_PHONE', 'CONFIRM_BOOKING')
+
+    def __init__(self, state_names=None):
+        """state_names — {номер состояния ConversationHandler: имя}"""
+        self.state_names = state_names or {}
+        self.handlers = {}
+        self.db = {}
+        self.handler_errors = Counter()
+        self.db_errors = Counter()
+        self.transitions = Counter()
+        self.booking_results = Counter()
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def add_collector(self, name, stats):
+        """Подключить источник мгновенных значений: stats() -> {имя: число}"""
+        self._collectors[name] = stats
+
+    def _observe(self, histograms, name, duration):
+        with self._lock:
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = Histogram()
+            histogram.observe(duration)
+
+    def state_name(self, state):
+        if state is None:
+            return 'SAME'
+        return self.state_names.get(state, str(state))
+
+    def instrument_handler(self, callback, from_state=None):
+        """Обернуть колбэк обработчика замером времени и учётом переходов.
+
+        from_state — имя состояния диалога, в котором срабатывает обработчик.
+        """
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                new_state = await callback(update, context)
+            except Exception:
+                with self._lock:
+                    self.handler_errors[name] += 1
+                raise
+            finally:
+                self._observe(self.handlers, name, time.perf_counter() - started)
+            if from_state is not None:
+                to_state = self.state_name(new_state)
+                if to_state != 'SAME' and to_state != from_state:
+                    with self._lock:
+                        self.transitions[(from_state, to_state)] += 1
+            return new_state
+
+        return wrapper
+
+    def instrument_application(self, application):
+        """Обернуть все обработчики приложения, включая состояния ConversationHandler"""
+        from telegram.ext import ConversationHandler
+
+        for group in application.handlers.values():
+            for handler in group:
+                if not isinstance(handler, ConversationHandler):
+                    handler.callback = self.instrument_handler(handler.callback)
+                    continue
+                for entry in handler.entry_points:
+                    entry.callback = self.instrument_handler(entry.callback, 'START')
+                for state, state_handlers in handler.states.items():
+                    for state_handler in state_handlers:
+                        state_handler.callback = self.instrument_handler(state_handler.callback, self.state_name(state))
+                for fallback in handler.fallbacks:
+                    fallback.callback = self.instrument_handler(fallback.callback, 'FALLBACK')
+
+    def instrument_db(self, name, func):
+        """Обернуть метод Database замером времени (вызывается в потоке БД)"""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.db_errors[name] += 1
+                raise
+            finally:
+                self._observe(self.db, name, time.perf_counter() - started)
+            if name == 'book_slot':
+                with self._lock:
+                    self.booking_results[result.value] += 1
+            return result
+
+        return wrapper
+
+    def funnel(self):
+        """[(шаг, сколько раз его достигли, доля потерь относительно предыдущего шага)].
+
+        Шаг считается достигнутым при переходе в него вперёд по сценарию
+        (возвраты кнопкой «Назад» не учитываются); последний шаг — созданная запись.
+        """
+        with self._lock:
+            reached = Counter()
+            for (from_state, to_state), count in self.transitions.items():
+                if to_state not in self.FUNNEL:
+                    continue
+                position = self.FUNNEL.index(to_state)
+                expected = self.FUNNEL[position - 1] if position else None
+                if from_state == expected or (expected is None and from_state not in self.FUNNEL):
+                    reached[to_state] += count
+            reached['BOOKED'] = self.booking_results['booked']
+
+        steps = []
+        previous = None
+        for step in self.FUNNEL + ('BOOKED',):
+            count = reached[step]
+            dropoff = 1 - count / previous if previous else 0.0
+            steps.append((step, count, max(dropoff, 0.0)))
+            previous = count
+        return steps
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for metric, histograms, label in (
+                ('carwash_handler_latency_seconds', self.handlers, 'handler'),
+                ('carwash_db_latency_seconds', self.db, 'method'),
+            ):
+                lines.append(f'# TYPE {metric} histogram')
+                for name, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.sum:.6f}')
+                    lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+
+            for metric, counter, label in (
+                ('carwash_handler_errors_total', self.handler_errors, 'handler'),
+                ('carwash_db_errors_total', self.db_errors, 'method'),
+                ('carwash_booking_results_total', self.booking_results, 'result'),
+            ):
+                lines.append(f'# TYPE {metric} counter')
+                for name, count in sorted(counter.items()):
+                    lines.append(f'{metric}{{{label}="{name}"}} {count}')
+
+            lines.append('# TYPE carwash_state_transitions_total counter')
+            for (from_state, to_state), count in sorted(self.transitions.items()):
+                lines.append(f'carwash_state_transitions_total{{from="{from_state}",to="{to_state}"}} {count}')
+
+        lines.append('# TYPE carwash_funnel_dropoff_ratio gauge')
+        for step, count, dropoff in self.funnel():
+            lines.append(f'carwash_funnel_dropoff_ratio{{step="{step}"}} {dropoff:.4f}')
+
+        for source, stats in self._collectors.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f'carwash_{source}_{key} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, top=8):
+        """Короткая сводка для команды /metrics: самые медленные обработчики и методы БД, воронка"""
+        with self._lock:
+            def slowest(histograms):
+                ranked = sorted(histograms.items(), key=lambda item: item[1].quantile(0.95), reverse=True)
+                return [(name, h.count, h.quantile(0.5), h.quantile(0.95)) for name, h in ranked[:top]]
+
+            handlers = slowest(self.handlers)
+            db = slowest(self.db)
+            errors = sum(self.handler_errors.values()) + sum(self.db_errors.values())
+        return {'handlers': handlers, 'db': db, 'errors': errors, 'funnel': self.funnel()}
+
+
+class MetricsServer:
+    """Локальный HTTP-эндпоинт /metrics для Prometheus"""
+
+    def __init__(self, metrics, host, port):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            logger.error(f"❌ Не удалось запустить эндпоинт метрик на {self.host}:{self.port}: {e}")
+            return
+        logger.info(f"📈 Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Заголовки запроса не нужны — дочитываем их до пустой строки
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.metrics.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
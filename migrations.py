@@ -0,0 +1,363 @@
+"""
+Версионные миграции схемы БД.
+
+Версия схемы хранится в PRAGMA user_version. Миграции применяются по
+порядку и один раз: каждая — в своей транзакции BEGIN IMMEDIATE вместе с
+записью новой версии, поэтому прерванная миграция не оставляет схему
+наполовину изменённой. Заполнение данных (backfill) идёт отдельными
+короткими транзакциями по MIGRATION_BATCH_SIZE строк; версия повышается
+только после последней пачки, и при повторном запуске обработка
+продолжается с оставшихся строк.
+
+Старт бота на актуальной БД — одно чтение PRAGMA user_version.
+
+Обновить большую БД заранее, до выкладки новой версии бота:
+    python migrations.py --db carwash_bot.db
+"""
+
+import argparse
+import logging
+import sqlite3
+
+from config import CAR_BODY_TYPES, WASH_TYPES, DB_PATH, MIGRATION_BATCH_SIZE
+from timetable import wash_duration
+
+logger = logging.getLogger(__name__)
+
+# Колонки записи, общие для bookings и bookings_archive (текущая схема)
+BOOKING_COLUMNS = (
+    'id, user_id, booking_date, booking_time, service, phone, car_body_type, wash_type, duration, status, created_at'
+)
+
+
+def _create_base_tables(conn):
+    """Пользователи и записи — схема первой версии бота"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            booking_date DATE NOT NULL,
+            booking_time TEXT NOT NULL,
+            service TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            UNIQUE(booking_date, booking_time, user_id)
+        )
+    ''')
+
+
+def _add_service_columns(conn):
+    """Тип кузова и тип мойки отдельными колонками"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(bookings)').fetchall()}
+    for column in ('car_body_type', 'wash_type'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE bookings ADD COLUMN {column} TEXT')
+
+
+def parse_service(service):
+    """(car_body_type, wash_type) по тексту услуги «Седан - Однофазная мойка»"""
+    body_name, _, wash_name = (service or '').partition(' - ')
+    bodies = {name: key for key, name in CAR_BODY_TYPES.items()}
+    washes = {name: key for key, name in WASH_TYPES.items()}
+    return bodies.get(body_name), washes.get(wash_name)
+
+
+def _backfill_service_columns(conn, batch_size):
+    """Заполнить car_body_type/wash_type старых записей из текста услуги.
+
+    Каждая пачка — отдельная транзакция. Обработанные строки больше не
+    попадают в выборку (car_body_type IS NULL), поэтому после перезапуска
+    работа продолжается с того места, где остановилась.
+    """
+    last_id = 0
+    filled = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = conn.execute('''
+            SELECT id, service FROM bookings
+            WHERE car_body_type IS NULL AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            conn.rollback()
+            break
+
+        updates = []
+        for booking_id, service in rows:
+            car_body_type, wash_type = parse_service(service)
+            # Нераспознанные услуги оставляем как есть — last_id не даёт выбрать их снова
+            if car_body_type is not None:
+                updates.append((car_body_type, wash_type, booking_id))
+        conn.executemany('''
+            UPDATE bookings SET car_body_type = ?, wash_type = COALESCE(wash_type, ?)
+            WHERE id = ?
+        ''', updates)
+        conn.commit()
+
+        filled += len(updates)
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            break
+
+    if filled:
+        logger.info(f"⏳ Заполнены тип кузова и мойки у записей: {filled}")
+
+
+def _create_outbox(conn):
+    """Очередь исходящих уведомлений"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            attempts INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _create_archive(conn):
+    """Архив завершённых и отменённых записей и представление всей истории"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bookings_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            booking_date DATE NOT NULL,
+            booking_time TEXT NOT NULL,
+            service TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            car_body_type TEXT,
+            wash_type TEXT,
+            status TEXT,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Колонки на момент этой миграции; duration добавлена в версии 8
+    columns = 'id, user_id, booking_date, booking_time, service, phone, car_body_type, wash_type, status, created_at'
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS bookings_all AS
+        SELECT {columns} FROM bookings
+        UNION ALL
+        SELECT {columns} FROM bookings_archive
+    ''')
+
+
+def _create_conversation_tables(conn):
+    """Состояние незавершённых диалогов (см. persistence.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_states (
+            name TEXT NOT NULL,
+            conversation_key TEXT NOT NULL,
+            user_id INTEGER,
+            state TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (name, conversation_key)
+        )
+    ''')
+
+
+def _create_indexes(conn):
+    """Индексы для горячих запросов.
+
+    Частичные индексы содержат только активные записи, поэтому их размер
+    не зависит от истории отменённых и завершённых записей.
+    """
+    # Доступность слотов, список всех записей, истечение записей
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_active_slot
+        ON bookings(booking_date, booking_time)
+        WHERE status = 'active'
+    ''')
+    # Записи пользователя
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_active_user
+        ON bookings(user_id, booking_date, booking_time)
+        WHERE status = 'active'
+    ''')
+    # Поиск записей для архивации: только неактивные, по дате
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_inactive_date
+        ON bookings(booking_date)
+        WHERE status != 'active'
+    ''')
+    # История пользователя в архиве
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_archive_user
+        ON bookings_archive(user_id, booking_date, booking_time)
+    ''')
+    # Ленивая загрузка диалогов пользователя при первом обращении
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversation_states_user
+        ON conversation_states(user_id)
+    ''')
+
+
+def _add_duration(conn):
+    """Длительность мойки в минутах: записи разной длины занимают пост разное время"""
+    for table in ('bookings', 'bookings_archive'):
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+        if 'duration' not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN duration INTEGER')
+
+    conn.execute('DROP VIEW IF EXISTS bookings_all')
+    conn.execute(f'''
+        CREATE VIEW bookings_all AS
+        SELECT {BOOKING_COLUMNS} FROM bookings
+        UNION ALL
+        SELECT {BOOKING_COLUMNS} FROM bookings_archive
+    ''')
+
+    # Занятость дня читается только из индекса, без обращения к таблице
+    conn.execute('DROP INDEX IF EXISTS idx_bookings_active_slot')
+    conn.execute('''
+        CREATE INDEX idx_bookings_active_slot
+        ON bookings(booking_date, booking_time, duration)
+        WHERE status = 'active'
+    ''')
+
+
+def _backfill_duration(conn, batch_size):
+    """Заполнить duration записей по типу кузова и мойки (пачками, с продолжением)"""
+    last_id = 0
+    filled = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = conn.execute('''
+            SELECT id, car_body_type, wash_type FROM bookings
+            WHERE duration IS NULL AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            conn.rollback()
+            break
+
+        conn.executemany(
+            'UPDATE bookings SET duration = ? WHERE id = ?',
+            [(wash_duration(car_body_type, wash_type), booking_id) for booking_id, car_body_type, wash_type in rows]
+        )
+        conn.commit()
+
+        filled += len(rows)
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            break
+
+    if filled:
+        logger.info(f"⏳ Заполнена длительность у записей: {filled}")
+
+
+class Migration:
+    """Шаг схемы: версия, описание и функция apply(conn).
+
+    batched — apply(conn, batch_size) сам управляет транзакциями
+    (заполнение данных пачками); версия записывается после него.
+    """
+
+    def __init__(self, version, description, apply, batched=False):
+        self.version = version
+        self.description = description
+        self.apply = apply
+        self.batched = batched
+
+
+# Порядок менять нельзя, новые миграции — только в конец.
+# Все шаги идемпотентны (IF NOT EXISTS, проверка колонок): БД, созданные
+# до появления миграций, имеют user_version = 0 и проходят их без ошибок.
+MIGRATIONS = (
+    Migration(1, 'пользователи и записи', _create_base_tables),
+    Migration(2, 'колонки car_body_type и wash_type', _add_service_columns),
+    Migration(3, 'заполнение car_body_type и wash_type', _backfill_service_columns, batched=True),
+    Migration(4, 'очередь уведомлений', _create_outbox),
+    Migration(5, 'архив записей', _create_archive),
+    Migration(6, 'состояние диалогов', _create_conversation_tables),
+    Migration(7, 'индексы', _create_indexes),
+    Migration(8, 'длительность мойки', _add_duration),
+    Migration(9, 'заполнение длительности мойки', _backfill_duration, batched=True),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, batch_size=MIGRATION_BATCH_SIZE):
+    """Применить недостающие миграции. Возвращает номера применённых версий.
+
+    Несколько процессов могут запускаться одновременно: версия
+    перепроверяется внутри транзакции, и чужая уже применённая миграция
+    пропускается.
+    """
+    version = schema_version(conn)
+    if version == LATEST_VERSION:
+        return []
+    if version > LATEST_VERSION:
+        raise RuntimeError(f"Версия схемы БД ({version}) новее, чем знает бот ({LATEST_VERSION})")
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        if migration.batched:
+            migration.apply(conn, batch_size)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) >= migration.version:
+                conn.rollback()
+                continue
+            if not migration.batched:
+                migration.apply(conn)
+            conn.execute(f'PRAGMA user_version = {migration.version}')
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+        logger.info(f"🧱 Миграция {migration.version}: {migration.description}")
+        applied.append(migration.version)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Обновить схему БД до текущей версии')
+    parser.add_argument('--db', default=DB_PATH, help='файл БД')
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE, help='строк в одной транзакции заполнения')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    conn = sqlite3.connect(args.db)
+    try:
+        before = schema_version(conn)
+        migrate(conn, args.batch_size)
+        print(f"Версия схемы: {before} → {schema_version(conn)}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden
+
+from config import NOTIFY_WORKERS, NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_DELAY, NOTIFY_MAX_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationQueue:
+    """Фоновая очередь исходящих уведомлений.
+
+    Обработчик только сохраняет уведомление в таблицу outbox и кладёт его
+    в очередь; отправкой занимаются фоновые воркеры. Неудачные отправки
+    повторяются с экспоненциальной паузой, а неотправленные уведомления
+    после перезапуска загружаются из БД заново. Постоянные ошибки Telegram
+    (BadRequest, Forbidden) не повторяются: уведомление сразу удаляется.
+    """
+
+    def __init__(self, db, send, workers=NOTIFY_WORKERS, max_attempts=NOTIFY_MAX_ATTEMPTS, retry_delay=NOTIFY_RETRY_DELAY):
+        """
+        db   — AsyncDatabase
+        send — корутина send(chat_id, text, parse_mode), отправляющая сообщение
+        """
+        self.db = db
+        self.send = send
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.sent = 0
+        self.failed = 0
+        self._queue = asyncio.Queue()
+        self._retries = set()
+        self._tasks = []
+        self._latencies = deque(maxlen=1000)
+
+    async def start(self):
+        """Загрузить неотправленные уведомления из БД и запустить воркеры"""
+        pending = await self.db.get_pending_notifications()
+        for row in pending:
+            self._queue.put_nowait(self._item(row['id'], row['chat_id'], row['text'], row['parse_mode'], row['attempts']))
+        if pending:
+            logger.info(f"📨 Загружено неотправленных уведомлений: {len(pending)}")
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Остановить воркеры; неотправленное остаётся в БД до следующего запуска"""
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, chat_id, text, parse_mode=None):
+        """Поставить уведомление в очередь"""
+        notification_id = await self.db.add_notification(chat_id, text, parse_mode)
+        self._queue.put_nowait(self._item(notification_id, chat_id, text, parse_mode, 0))
+
+    @staticmethod
+    def _item(notification_id, chat_id, text, parse_mode, attempts):
+        return {
+            'id': notification_id,
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': parse_mode,
+            'attempts': attempts,
+            'enqueued_at': time.monotonic(),
+        }
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                logger.error(f"❌ Ошибка в очереди уведомлений: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, item):
+        try:
+            await self.send(item['chat_id'], item['text'], item['parse_mode'])
+        except (BadRequest, Forbidden) as e:
+            # Повтор не поможет: неверный текст или бот заблокирован в чате
+            self.failed += 1
+            await self.db.delete_notification(item['id'])
+            logger.error(f"❌ Уведомление #{item['id']} отклонено Telegram: {e}")
+            return
+        except Exception as e:
+            item['attempts'] += 1
+            await self.db.record_notification_attempt(item['id'])
+
+            if item['attempts'] >= self.max_attempts:
+                self.failed += 1
+                await self.db.delete_notification(item['id'])
+                logger.error(f"❌ Уведомление #{item['id']} не отправлено после {item['attempts']} попыток: {e}")
+                return
+
+            delay = min(self.retry_delay * 2 ** (item['attempts'] - 1), NOTIFY_MAX_RETRY_DELAY)
+            logger.warning(f"⚠️ Не удалось отправить уведомление #{item['id']}, повтор через {delay} с: {e}")
+            handle = asyncio.get_running_loop().call_later(delay, lambda: self._requeue(handle, item))
+            self._retries.add(handle)
+            return
+
+        await self.db.delete_notification(item['id'])
+        self.sent += 1
+        self._latencies.append(time.monotonic() - item['enqueued_at'])
+
+    def _requeue(self, handle, item):
+        self._retries.discard(handle)
+        self._queue.put_nowait(item)
+
+    def stats(self):
+        """Глубина очереди и задержка отправки (секунды, по последним 1000 уведомлениям)"""
+        latencies = sorted(self._latencies)
+        return {
+            'depth': self._queue.qsize() + len(self._retries),
+            'sent': self.sent,
+            'failed': self.failed,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            'latency_max': latencies[-1] if latencies else 0.0,
+        }
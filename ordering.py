@@ -0,0 +1,102 @@
+import asyncio
+from collections import deque
+
+from telegram.ext import Application
+
+from config import UPDATE_CONCURRENCY
+
+
+class PerUserOrderedApplication(Application):
+    """Application с параллельной обработкой обновлений разных пользователей.
+
+    Обновления одного пользователя складываются в его очередь и
+    обрабатываются одной задачей строго по порядку поступления, поэтому
+    переходы ConversationHandler не перемешиваются. Обновления разных
+    пользователей обрабатываются параллельно, не больше max_concurrency
+    одновременно. Слот занимает очередь пользователя, а не каждое
+    обновление: накопившиеся обновления одного чата держат один слот и не
+    задерживают остальных пользователей.
+
+    Если persistence умеет load_user (persistence.SQLitePersistence),
+    сохранённое состояние пользователя подгружается перед обработкой его
+    первого обновления — раньше, чем дойдёт до ConversationHandler.
+    """
+
+    def __init__(self, *, max_concurrency=UPDATE_CONCURRENCY, **kwargs):
+        super().__init__(**kwargs)
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._queues = {}
+
+    @staticmethod
+    def ordering_key(update):
+        """Ключ очереди: пользователь, а для обновлений без пользователя — чат"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return ('user', user.id)
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return ('chat', chat.id)
+        return None
+
+    async def process_update(self, update):
+        if self.max_concurrency <= 1:
+            await self.restore_user(update)
+            return await super().process_update(update)
+
+        key = self.ordering_key(update)
+        queue = self._queues.get(key) if key is not None else None
+        if queue is not None:
+            # Очередь пользователя уже обрабатывается — её задача дойдёт и до этого обновления
+            queue.append(update)
+            return
+
+        # Ждём свободного слота: так выборка обновлений притормаживает при перегрузке
+        await self._slots.acquire()
+
+        queue = self._queues.get(key) if key is not None else None
+        if queue is not None:
+            queue.append(update)
+            self._slots.release()
+            return
+        queue = deque([update])
+        if key is not None:
+            self._queues[key] = queue
+
+        self.create_task(self._drain(key, queue), update=update)
+
+    async def restore_user(self, update):
+        """Подгрузить user_data и состояния диалогов пользователя из persistence"""
+        load_user = getattr(self.persistence, 'load_user', None)
+        user = getattr(update, 'effective_user', None)
+        if load_user is None or user is None:
+            return
+
+        loaded = await load_user(user.id)
+        if loaded is None:
+            return
+        user_data, conversations = loaded
+
+        # То, что уже есть в памяти, новее сохранённого
+        if user_data is not None and user.id not in self._user_data:
+            self._user_data[user.id] = user_data
+        for name, states in conversations.items():
+            tracked = self._conversation_handler_conversations.get(name)
+            if tracked is not None:
+                tracked.update_no_track({key: state for key, state in states.items() if key not in tracked})
+
+    async def _drain(self, key, queue):
+        """Обработать очередь пользователя по порядку и освободить слот"""
+        try:
+            while queue:
+                update = queue.popleft()
+                try:
+                    await self.restore_user(update)
+                    await super().process_update(update)
+                except Exception as exc:
+                    # Ошибка одного обновления не должна останавливать очередь пользователя
+                    await self.process_error(update=update, error=exc)
+        finally:
+            if self._queues.get(key) is queue:
+                del self._queues[key]
+            self._slots.release()
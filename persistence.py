@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import PERSISTENCE_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранение состояния диалогов и user_data в основной БД бота.
+
+    Изменения не пишутся на каждое обновление: Application раз в
+    update_interval секунд отдаёт накопленное, и всё это уходит в БД одной
+    транзакцией. Данные пользователя загружаются лениво — при первом его
+    обновлении после запуска (см. ordering.PerUserOrderedApplication),
+    а не все сразу при старте. При остановке буфер сбрасывается в БД.
+    """
+
+    def __init__(self, db, update_interval=PERSISTENCE_FLUSH_INTERVAL):
+        """db — AsyncDatabase"""
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self.writes = 0
+        self._user_data = {}
+        self._states = {}
+        self._loaded = set()
+        self._write_task = None
+
+    async def load_user(self, user_id):
+        """Загрузить сохранённое состояние пользователя, если ещё не загружали.
+
+        Возвращает (user_data, {имя диалога: {ключ: состояние}}) или None.
+        """
+        if user_id in self._loaded:
+            return None
+        self._loaded.add(user_id)
+
+        data, rows = await self.db.load_conversation_data(user_id)
+        conversations = {}
+        for row in rows:
+            key = tuple(json.loads(row['conversation_key']))
+            conversations.setdefault(row['name'], {})[key] = json.loads(row['state'])
+        return (json.loads(data) if data is not None else None), conversations
+
+    # Всё загружается лениво через load_user
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        # Ключ диалога по умолчанию — (chat_id, user_id): пользователь последний
+        user_id = key[-1] if key else None
+        state = json.dumps(new_state) if new_state is not None else None
+        self._states[(name, json.dumps(list(key)))] = (user_id, state)
+        self._schedule_write()
+
+    async def update_user_data(self, user_id, data):
+        self._loaded.add(user_id)
+        self._user_data[user_id] = json.dumps(data, ensure_ascii=False)
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._user_data[user_id] = None
+        self._schedule_write()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def _schedule_write(self):
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        # Даём Application отдать все изменения текущего прохода, затем пишем их разом
+        await asyncio.sleep(0)
+        while self._user_data or self._states:
+            user_data, self._user_data = self._user_data, {}
+            states, self._states = self._states, {}
+            try:
+                await self.db.save_conversation_data(user_data, states)
+                self.writes += 1
+            except Exception as e:
+                # Вернуть в буфер, не затирая более свежие изменения, и повторить в следующий раз
+                self._user_data = {**user_data, **self._user_data}
+                self._states = {**states, **self._states}
+                logger.error(f"❌ Не удалось сохранить состояние диалогов: {e}")
+                return
+
+    async def flush(self):
+        """Дописать всё накопленное в БД (вызывается при остановке)"""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
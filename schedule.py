@@ -0,0 +1,78 @@
+"""
+Занятость постов мойки за день — интервальный индекс для проверки пересечений.
+
+Каждая активная запись занимает пост на отрезке [начало, начало + длительность)
+минут от начала суток. Мойка помещается, если на всём её отрезке одновременно
+занято меньше WASH_BAYS постов: отрезки времени всегда можно распределить по
+постам, если их одновременно не больше, чем постов, поэтому номера постов
+хранить не нужно.
+"""
+
+import bisect
+
+from config import WASH_BAYS
+from timetable import DAY_CLOSES, SLOT_GRID
+
+
+class DaySchedule:
+    """Число одновременных моек за день как ступенчатая функция.
+
+    bounds — отсортированные точки, где меняется занятость; load[i] — число
+    моек на [bounds[i], bounds[i + 1]). Индекс строится один раз на день
+    (O(n log n)), проверка отрезка — бинарный поиск и проход только по
+    ступеням внутри него.
+    """
+
+    def __init__(self, intervals=(), bays=WASH_BAYS):
+        """intervals — [(начало, конец)] в минутах от начала суток"""
+        self.bays = bays
+        self.bookings = 0
+        delta = {}
+        for start, end in intervals:
+            delta[start] = delta.get(start, 0) + 1
+            delta[end] = delta.get(end, 0) - 1
+            self.bookings += 1
+
+        self.bounds = sorted(delta)
+        self.load = []
+        current = 0
+        for point in self.bounds:
+            current += delta[point]
+            self.load.append(current)
+
+    def peak(self, start, end):
+        """Наибольшее число одновременных моек на отрезке [start, end)"""
+        first = bisect.bisect_right(self.bounds, start) - 1
+        last = bisect.bisect_left(self.bounds, end)
+        peak = self.load[first] if first >= 0 else 0
+        for index in range(first + 1, last):
+            if self.load[index] > peak:
+                peak = self.load[index]
+        return peak
+
+    def free_bays(self, start, end):
+        """Сколько постов свободно на всём отрезке [start, end)"""
+        return max(self.bays - self.peak(start, end), 0)
+
+    def fits(self, start, duration):
+        """Помещается ли мойка длительностью duration с началом в start"""
+        end = start + duration
+        return end <= DAY_CLOSES and self.peak(start, end) < self.bays
+
+    def open_starts(self, duration, after=None):
+        """[(слот, свободных постов)] для времён начала, в которые мойка помещается.
+
+        after — минуты от начала суток: более ранние начала пропускаются
+        (уже прошедшее время сегодняшнего дня).
+        """
+        starts = []
+        for slot in SLOT_GRID:
+            end = slot.minutes + duration
+            if end > DAY_CLOSES:
+                break
+            if after is not None and slot.minutes <= after:
+                continue
+            free = self.free_bays(slot.minutes, end)
+            if free > 0:
+                starts.append((slot, free))
+        return starts
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+from config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Сколько корзин чатов держать, прежде чем удалять простаивающие
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Забрать токен; вернуть, сколько секунд нужно подождать до его появления"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_full(self):
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class RateLimitedSender:
+    """Единая точка отправки и редактирования сообщений с учётом лимитов Telegram.
+
+    Общий лимит (~30 сообщений/с) и лимит на чат (~1 сообщение/с) соблюдаются
+    корзинами токенов: вызов ждёт своей очереди, а не получает ошибку флуда.
+    Несколько правок одного сообщения, ожидающих отправки, схлопываются
+    в одну — уходит последняя. При RetryAfter все отправки приостанавливаются
+    на указанное Telegram время, и вызов повторяется.
+    """
+
+    def __init__(self, bot=None, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE,
+                 chat_burst=SEND_CHAT_BURST, max_retries=SEND_MAX_RETRIES):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.flood_waits = 0
+        self.coalesced_edits = 0
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._pending_edits = {}
+        self._paused_until = 0.0
+
+    async def _acquire(self, chat_id):
+        """Дождаться токенов чата и общего лимита"""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_full()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+
+        delay = bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        delay = max(self._global.reserve(), self._paused_until - time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _call(self, chat_id, method, **kwargs):
+        """Вызвать метод Bot API в рамках лимитов, повторяя после RetryAfter"""
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id)
+            try:
+                return await method(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.flood_waits += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"⏳ Лимит Telegram, пауза {e.retry_after} с (чат {chat_id})")
+
+    async def send_message(self, chat_id, text, **kwargs):
+        """Отправить сообщение"""
+        return await self._call(chat_id, self.bot.send_message, text=text, **kwargs)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        """Отредактировать сообщение; ожидающие правки того же сообщения схлопываются"""
+        key = (chat_id, message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Правка ещё не ушла — подменяем её содержимое и ждём общего результата
+            pending['kwargs'] = dict(kwargs, text=text)
+            self.coalesced_edits += 1
+            return await asyncio.shield(pending['future'])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending_edits[key] = pending = {'kwargs': dict(kwargs, text=text), 'future': future}
+        try:
+            await self._acquire(chat_id)
+            # Токен получен: дальше правки этого сообщения ставятся в новую очередь
+            del self._pending_edits[key]
+            result = await self._call_acquired(chat_id, message_id, pending['kwargs'])
+        except BaseException as e:
+            # Под тем же ключом может уже ждать правка следующего вызова — её не трогаем
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            if not future.done():
+                future.set_exception(e)
+                # Исключение получит и этот вызов; не даём asyncio ругаться на непрочитанное
+                future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+    async def _call_acquired(self, chat_id, message_id, kwargs):
+        try:
+            return await self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, **kwargs)
+        except RetryAfter as e:
+            self.flood_waits += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"⏳ Лимит Telegram, пауза {e.retry_after} с (чат {chat_id})")
+            return await self._call(chat_id, self.bot.edit_message_text, message_id=message_id, **kwargs)
+
+    async def reply_text(self, message, text, **kwargs):
+        """Ответить на сообщение пользователя"""
+        return await self.send_message(message.chat_id, text, **kwargs)
+
+    async def edit_query_message(self, query, text, **kwargs):
+        """Отредактировать сообщение, к которому привязана callback-кнопка"""
+        if query.message is None:
+            # Inline-сообщение: chat_id неизвестен, редактируем напрямую
+            return await query.edit_message_text(text, **kwargs)
+        return await self.edit_message_text(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+    def stats(self):
+        """Счётчики ожиданий флуд-контроля и схлопнутых правок"""
+        return {
+            'flood_waits': self.flood_waits,
+            'coalesced_edits': self.coalesced_edits,
+            'chats': len(self._chats),
+        }
@@ -0,0 +1,158 @@
+"""
+Трассировка SQL-запросов Database.
+
+Включается SQL_TRACE в config.py (или Database(trace=True)). Подключения
+пула создают курсоры TracingCursor — и в cursor(), и в сокращениях
+conn.execute()/executemany()/executescript(), — которые для каждого запроса замеряют
+время, число параметров и строк. Запросы дольше SQL_SLOW_QUERY_MS пишутся
+в журнал медленных запросов, а по каждому тексту запроса копятся
+агрегаты: число вызовов, суммарное, среднее и максимальное время.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from config import SQL_SLOW_QUERY_MS, SQL_SLOW_LOG
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('sqltrace.slow')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Текст запроса в одну строку — ключ для агрегатов"""
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class SqlTracer:
+    """Сбор статистики по SQL-запросам из всех потоков БД"""
+
+    def __init__(self, slow_query_ms=SQL_SLOW_QUERY_MS, slow_log=SQL_SLOW_LOG):
+        self.slow_query_ms = slow_query_ms
+        self.slow_queries = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+        if slow_log and not any(getattr(h, 'baseFilename', None) == slow_log for h in slow_logger.handlers):
+            handler = logging.FileHandler(slow_log, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_logger.addHandler(handler)
+
+    def record(self, sql, binds, duration, rows):
+        """Учесть выполненный запрос"""
+        statement = normalize(sql)
+        with self._lock:
+            stats = self._stats.get(statement)
+            if stats is None:
+                stats = self._stats[statement] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0}
+            stats['calls'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+            stats['rows'] += max(rows, 0)
+            slow = duration * 1000 >= self.slow_query_ms
+            if slow:
+                self.slow_queries += 1
+
+        if slow:
+            slow_logger.warning(f"🐢 {duration * 1000:.1f} мс, параметров: {binds}, строк: {rows}: {statement}")
+
+    def stats(self):
+        """Агрегаты по запросам, самые затратные по суммарному времени — первыми"""
+        with self._lock:
+            items = [(statement, dict(stats)) for statement, stats in self._stats.items()]
+        report = [
+            {
+                'statement': statement,
+                'calls': stats['calls'],
+                'total_ms': round(stats['total'] * 1000, 3),
+                'mean_ms': round(stats['total'] / stats['calls'] * 1000, 3),
+                'max_ms': round(stats['max'] * 1000, 3),
+                'rows': stats['rows'],
+            }
+            for statement, stats in items
+        ]
+        report.sort(key=lambda item: item['total_ms'], reverse=True)
+        return report
+
+    def dump(self, limit=20):
+        """Записать в лог самые затратные запросы"""
+        report = self.stats()
+        if not report:
+            return
+        lines = [f"📊 SQL-статистика (запросов: {len(report)}, медленных: {self.slow_queries}):"]
+        for item in report[:limit]:
+            lines.append(
+                f"  {item['calls']:>7} × {item['mean_ms']:>8.3f} мс = {item['total_ms']:>10.1f} мс "
+                f"(max {item['max_ms']:.1f}) {item['statement'][:160]}"
+            )
+        logger.info('\n'.join(lines))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow_queries = 0
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Курсор, сообщающий о каждом запросе трассировщику подключения.
+
+    Результат SELECT вычитывается сразу, чтобы в замер попало всё время
+    выполнения запроса и было известно число строк; fetch* отдают его из буфера.
+    """
+
+    _rows = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        if self.description is not None:
+            self._rows = super().fetchall()
+            rows = len(self._rows)
+        else:
+            self._rows = None
+            rows = self.rowcount
+        self.connection.tracer.record(sql, len(parameters), time.perf_counter() - started, rows)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._rows = None
+        binds = sum(len(parameters) for parameters in seq_of_parameters)
+        self.connection.tracer.record(sql, binds, time.perf_counter() - started, self.rowcount)
+        return self
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        super().executescript(sql_script)
+        self._rows = None
+        self.connection.tracer.record(sql_script, 0, time.perf_counter() - started, self.rowcount)
+        return self
+
+    def fetchone(self):
+        if self._rows is None:
+            return super().fetchone()
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=None):
+        if self._rows is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        size = self.arraysize if size is None else size
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        if self._rows is None:
+            return super().fetchall()
+        rows, self._rows = self._rows, []
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
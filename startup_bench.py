@@ -0,0 +1,167 @@
+"""
+Бенчмарк холодного старта бота.
+
+Каждый прогон — отдельный процесс Python с пустыми кэшами модулей, как
+при перезапуске сервиса. Процесс собирает приложение (build_application)
+с заглушкой Bot API над заранее заполненной БД, запускает его и отправляет
+первые обновления сценария записи:
+/start → book_wash → body_ → wash_ (выбор даты) → date_ (выбор времени).
+
+Время до первого ответа (time_to_first_update_s) отсчитывается от запуска
+процесса и складывается из фаз: старт интерпретатора, импорты, сборка
+приложения, initialize/post_init (включая прогрев) и обработка /start.
+Отдельно замеряются первые обращения к доступности дат и времени — их
+задержка показывает, насколько прогреты кэши.
+
+Примеры:
+    python startup_bench.py
+    python startup_bench.py --runs 10 --bookings 100000 --output startup.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from config import SEND_CHAT_RATE
+
+
+async def first_updates(application, request):
+    """Запустить приложение, прогнать первые шаги сценария, вернуть фазы (с)"""
+    from loadtest import callback_update, message_update
+    from timetable import DATE_TABLE
+
+    phases = {}
+    started = time.perf_counter()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    phases['startup_s'] = time.perf_counter() - started
+
+    user_id = 100001
+    bot = application.bot
+    updates = [
+        message_update(bot, 1, user_id, '/start'),
+        callback_update(bot, 2, user_id, 'book_wash'),
+        # Выбор кузова сразу ведёт к типу мойки, а тип мойки — к списку дат
+        callback_update(bot, 3, user_id, 'body_sedan'),
+        callback_update(bot, 4, user_id, 'wash_single'),
+        callback_update(bot, 5, user_id, f'date_{DATE_TABLE.days()[1].iso}'),
+    ]
+    names = ('start', 'book_wash', 'select_car_body', 'select_wash_type', 'select_date')
+    try:
+        for name, update in zip(names, updates):
+            if name != 'start':
+                # Пауза «пользователя» между нажатиями, чтобы не упираться в лимит отправки в чат
+                await asyncio.sleep(1 / SEND_CHAT_RATE)
+            request.replied.clear()
+            step_started = time.perf_counter()
+            await application.update_queue.put(update)
+            await asyncio.wait_for(request.replied.wait(), 30)
+            phases[f'{name}_s'] = time.perf_counter() - step_started
+    finally:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+    return phases
+
+
+def child(db_path, spawned_at):
+    """Один холодный старт; печатает фазы в JSON"""
+    interpreter_s = time.time() - spawned_at
+    started = time.perf_counter()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    from bot import build_application
+    from stub_bot import StubRequest, STUB_TOKEN
+    imported = time.perf_counter()
+
+    class RepliedRequest(StubRequest):
+        """Заглушка, отмечающая каждый ответ пользователю"""
+
+        def __init__(self):
+            super().__init__()
+            self.replied = asyncio.Event()
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            result = await super().do_request(url, method, request_data, **kwargs)
+            if url.endswith(('/sendMessage', '/editMessageText')):
+                self.replied.set()
+            return result
+
+    request = RepliedRequest()
+    application = build_application(token=STUB_TOKEN, request=request, db_path=db_path)
+    built = time.perf_counter()
+
+    phases = asyncio.run(first_updates(application, request))
+    report = {
+        'interpreter_s': interpreter_s,
+        'import_s': imported - started,
+        'build_s': built - imported,
+        **phases,
+    }
+    report['time_to_first_update_s'] = (
+        interpreter_s + report['import_s'] + report['build_s'] + report['startup_s'] + report['start_s']
+    )
+    print(json.dumps(report))
+
+
+def run_child(db_path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', db_path, str(time.time())],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк холодного старта бота')
+    parser.add_argument('--runs', type=int, default=5, help='число холодных стартов')
+    parser.add_argument('--bookings', type=int, default=10 ** 4, help='записей в истории БД')
+    parser.add_argument('--output', help='сохранить отчёт в JSON-файл')
+    parser.add_argument('--child', nargs=2, metavar=('DB', 'SPAWNED_AT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], float(args.child[1]))
+        return
+
+    from bench_db import seed
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_path = os.path.join(db_dir, 'startup.db')
+        seed(db_path, args.bookings, max(args.bookings // 10, 100), stale_active=0, rng=random.Random(1))
+        runs = [run_child(db_path) for _ in range(args.runs)]
+
+    report = {
+        'runs': args.runs,
+        'bookings': args.bookings,
+        'phases': {
+            phase: {
+                'median_ms': round(statistics.median(run[phase] for run in runs) * 1000, 2),
+                'max_ms': round(max(run[phase] for run in runs) * 1000, 2),
+            }
+            for phase in runs[0]
+        },
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
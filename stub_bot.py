@@ -0,0 +1,78 @@
+"""
+Заглушка Bot API для локальных нагрузочных тестов.
+
+StubRequest подставляется в Application вместо HTTP-клиента: на каждый
+вызов Bot API он сразу отвечает правдоподобным результатом, ничего не
+отправляя в Telegram. Так бота можно гонять без сети и без токена.
+"""
+
+import asyncio
+import json
+import time
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+# Токен подходящего формата: Bot проверяет только, что он непустой
+STUB_TOKEN = '123456:STUB'
+
+STUB_BOT_USER = {
+    'id': 123456,
+    'is_bot': True,
+    'first_name': 'CarWash Stub',
+    'username': 'carwash_stub_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+
+class StubRequest(BaseRequest):
+    """Отвечает на вызовы Bot API без сети.
+
+    latency — искусственная задержка ответа в секундах (имитация сети).
+    calls — счётчик вызванных методов Bot API.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        params = request_data.parameters if request_data is not None else {}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        elif api_method == 'getUpdates':
+            # Долгий опрос без обновлений: не крутим цикл вхолостую
+            await asyncio.sleep(1)
+
+        result = self._result(api_method, params)
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    def _result(self, api_method, params):
+        if api_method == 'getMe':
+            return STUB_BOT_USER
+        if api_method == 'getUpdates':
+            return []
+        if api_method in ('sendMessage', 'editMessageText'):
+            if api_method == 'sendMessage' or 'message_id' not in params:
+                self._message_id += 1
+            return {
+                'message_id': params.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': params.get('chat_id', 0), 'type': 'private'},
+                'from': STUB_BOT_USER,
+                'text': params.get('text', ''),
+            }
+        return True
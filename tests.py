@@ -2,10 +2,20 @@
 Тесты для бота автомойки
 """
 
+import asyncio
+import threading
 import unittest
 import os
 from datetime import datetime, timedelta
-from database import Database
+from database import Database, AsyncDatabase, BookingResult
+from cache import KnownUsersCache
+
+
+def remove_db_files(path):
+    """Удалить файл БД вместе с WAL-журналом"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
 
 class TestDatabase(unittest.TestCase):
     """Тесты для работы с БД"""
@@ -14,19 +24,18 @@ class TestDatabase(unittest.TestCase):
         """Подготовка к тестам"""
         # Используем тестовую БД
         self.test_db_path = 'test_carwash.db'
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        remove_db_files(self.test_db_path)
         
         # Переопределяем путь к БД
         import config
         config.DB_PATH = self.test_db_path
         
-        self.db = Database()
+        self.db = Database(self.test_db_path)
     
     def tearDown(self):
         """Очистка после тестов"""
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        self.db.close()
+        remove_db_files(self.test_db_path)
     
     def test_add_user(self):
         """Тест добавления пользователя"""
@@ -42,6 +51,24 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(user['username'], 'testuser')
         self.assertEqual(user['first_name'], 'Test')
     
+    def test_add_user_upsert(self):
+        """Тест: повторный /start не пишет в БД и не стирает телефон"""
+        self.assertTrue(self.db.add_user(123, 'testuser', 'Test'))
+        self.db.update_user_phone(123, '+79991234567')
+
+        self.assertFalse(self.db.add_user(123, 'testuser', 'Test'))
+        self.assertEqual(self.db.known_users.stats()['hits'], 1)
+
+        # Без кэша (например, после перезапуска) неизменённая строка тоже не перезаписывается
+        self.db.known_users = KnownUsersCache(maxsize=1)
+        self.assertFalse(self.db.add_user(123, 'testuser', 'Test'))
+        self.assertTrue(self.db.add_user(123, 'newname', 'Test'))
+        self.db.add_user(456, 'other', 'Other')
+        self.assertEqual(self.db.known_users.stats()['size'], 1)
+
+        user = self.db.get_connection().execute('SELECT * FROM users WHERE user_id = 123').fetchone()
+        self.assertEqual((user['username'], user['phone']), ('newname', '+79991234567'))
+
     def test_update_phone(self):
         """Тест обновления номера телефона"""
         self.db.add_user(123, 'testuser', 'Test')
@@ -84,6 +111,7 @@ class TestDatabase(unittest.TestCase):
     
     def test_duplicate_booking(self):
         """Тест предотвращения дублирования записей"""
+        from config import WASH_BAYS
         tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
         
         # Первая запись должна пройти
@@ -96,30 +124,31 @@ class TestDatabase(unittest.TestCase):
         )
         self.assertTrue(success1)
         
-        # Вторая запись на то же время должна не пройти
-        success2 = self.db.add_booking(
-            user_id=456,
-            booking_date=tomorrow,
-            booking_time='10:00',
-            service='Стандартная мойка',
-            phone='+79991234568'
-        )
-        self.assertFalse(success2)
+        # Повторная запись того же пользователя на то же время — дубликат
+        result = self.db.book_slot(123, tomorrow, '10:00', 'Стандартная мойка', '+79991234567')
+        self.assertIs(result, BookingResult.DUPLICATE)
+        
+        # Другие пользователи занимают оставшиеся посты, сверх них — отказ
+        for user_id in range(1, WASH_BAYS):
+            self.assertTrue(self.db.add_booking(456 + user_id, tomorrow, '10:00', 'Стандартная мойка', '+79991234568'))
+        self.assertFalse(self.db.add_booking(999, tomorrow, '10:00', 'Стандартная мойка', '+79991234569'))
     
     def test_get_available_times(self):
         """Тест получения доступного времени"""
         tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
         
+        from config import WASH_BAYS
+        from timetable import SLOT_TIMES
         times = self.db.get_available_times(tomorrow)
         
-        # Должно быть 10 слотов (9:00 - 19:00)
-        self.assertEqual(len(times), 10)
+        # На свободный день доступны все слоты сетки
+        self.assertEqual([time_slot['time'] for time_slot in times], list(SLOT_TIMES))
         
         # Проверяем формат времени
         for time_slot in times:
             self.assertIn('time', time_slot)
             self.assertIn('available', time_slot)
-            self.assertEqual(time_slot['available'], 3)  # Максимум 3 записи
+            self.assertEqual(time_slot['available'], WASH_BAYS)  # Свободны все посты
     
     def test_get_user_bookings(self):
         """Тест получения записей пользователя"""
@@ -153,6 +182,1099 @@ class TestDatabase(unittest.TestCase):
         bookings = self.db.get_user_bookings(123)
         self.assertEqual(len(bookings), 0)  # Активных записей не должно быть
 
+    def test_get_available_dates_capacity(self):
+        """Тест: полностью занятый день исключается из доступных дат"""
+        from config import DAYS_AHEAD, MAX_BOOKINGS_PER_SLOT
+        from timetable import SLOT_TIMES
+
+        today = datetime.now().date()
+        tomorrow = today + timedelta(days=1)
+        day_after = today + timedelta(days=2)
+
+        for time_str in SLOT_TIMES:
+            for user_id in range(MAX_BOOKINGS_PER_SLOT):
+                self.db.add_booking(user_id, tomorrow.strftime('%Y-%m-%d'), time_str, 'Мойка', '+79991234567')
+        # Частично занятый день остаётся доступным
+        self.db.add_booking(1, day_after.strftime('%Y-%m-%d'), '09:00', 'Мойка', '+79991234567')
+
+        dates = self.db.get_available_dates()
+
+        self.assertNotIn(tomorrow, dates)
+        self.assertEqual(
+            [date for date in dates if date > tomorrow],
+            [today + timedelta(days=i) for i in range(2, DAYS_AHEAD + 1)]
+        )
+
+    def test_get_available_times_occupancy(self):
+        """Тест: занятость слотов дня считается одним запросом"""
+        from config import MAX_BOOKINGS_PER_SLOT
+        from timetable import SLOT_TIMES
+
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        first_slot, second_slot = SLOT_TIMES[:2]
+        for user_id in range(MAX_BOOKINGS_PER_SLOT):
+            self.db.add_booking(user_id, tomorrow, first_slot, 'Мойка', '+79991234567')
+        self.db.add_booking(1, tomorrow, second_slot, 'Мойка', '+79991234567')
+
+        statements = []
+        self.db.get_connection().set_trace_callback(statements.append)
+        times = {slot['time']: slot['available'] for slot in self.db.get_available_times(tomorrow)}
+        self.db.get_connection().set_trace_callback(None)
+
+        self.assertEqual(len([sql for sql in statements if 'SELECT' in sql]), 1)
+        self.assertNotIn(first_slot, times)
+        self.assertEqual(times[second_slot], MAX_BOOKINGS_PER_SLOT - 1)
+        self.assertEqual(len(times), len(SLOT_TIMES) - 1)
+
+    def test_book_slot_results(self):
+        """Тест: бронирование возвращает типизированный результат"""
+        from config import MAX_BOOKINGS_PER_SLOT
+
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        for user_id in range(MAX_BOOKINGS_PER_SLOT):
+            result = self.db.book_slot(user_id, tomorrow, '10:30', 'Мойка', '+79991234567')
+            self.assertIs(result, BookingResult.BOOKED)
+
+        self.assertIs(self.db.book_slot(0, tomorrow, '10:30', 'Мойка', '+79991234567'), BookingResult.DUPLICATE)
+        self.assertIs(self.db.book_slot(999, tomorrow, '10:30', 'Мойка', '+79991234567'), BookingResult.SLOT_FULL)
+
+    def test_wash_duration_overlap(self):
+        """Тест: длинная мойка занимает пост на все пересекающиеся времена начала"""
+        from config import WASH_BAYS, WASH_DURATIONS
+        from timetable import SLOT_TIMES, to_minutes
+
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        # Все посты заняты двухфазной мойкой грузовиков с начала дня
+        for user_id in range(WASH_BAYS):
+            result = self.db.book_slot(user_id, tomorrow, '09:00', 'Грузовик', '+79991234567', 'truck', 'double')
+            self.assertIs(result, BookingResult.BOOKED)
+        ends = 9 * 60 + WASH_DURATIONS[('truck', 'double')]
+
+        times = [slot['time'] for slot in self.db.get_available_times(tomorrow, 'sedan', 'single')]
+        self.assertEqual(times, [time_str for time_str in SLOT_TIMES if to_minutes(time_str) >= ends])
+        self.assertIs(
+            self.db.book_slot(99, tomorrow, '10:30', 'Седан', '+79991234567', 'sedan', 'single'),
+            BookingResult.SLOT_FULL
+        )
+
+        # Длинная мойка не предлагается, если не успевает закончиться до конца дня
+        truck_times = [slot['time'] for slot in self.db.get_available_times(tomorrow, 'truck', 'double')]
+        self.assertNotIn(SLOT_TIMES[-1], truck_times)
+        self.assertIs(
+            self.db.book_slot(99, tomorrow, SLOT_TIMES[-1], 'Грузовик', '+79991234567', 'truck', 'double'),
+            BookingResult.SLOT_FULL
+        )
+
+    def test_rebook_after_cancel(self):
+        """Тест: после отмены можно снова записаться на тот же слот"""
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self.db.book_slot(123, tomorrow, '10:30', 'Мойка', '+79991234567')
+        booking_id = self.db.get_user_bookings(123)[0]['id']
+        self.db.cancel_booking(booking_id, 123)
+
+        result = self.db.book_slot(123, tomorrow, '10:30', 'Мойка', '+79990000000')
+
+        self.assertIs(result, BookingResult.BOOKED)
+        self.assertEqual(self.db.get_user_bookings(123)[0]['phone'], '+79990000000')
+
+    def test_archive_bookings(self):
+        """Тест: старые неактивные записи переносятся в архив и видны в истории"""
+        old_date = (datetime.now().date() - timedelta(days=60)).strftime('%Y-%m-%d')
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        conn = self.db.get_connection()
+        conn.executemany(
+            "INSERT INTO bookings (user_id, booking_date, booking_time, service, phone, status) VALUES (123, ?, ?, 'Мойка', 'p', ?)",
+            [(old_date, '09:00', 'completed'), (old_date, '10:30', 'cancelled'), (old_date, '12:00', 'completed')]
+        )
+        conn.commit()
+        conn.close()
+        self.db.book_slot(123, tomorrow, '10:30', 'Мойка', '+79991234567')
+
+        self.assertEqual(self.db.archive_bookings(older_than_days=30, batch_size=2), 3)
+        self.assertEqual(self.db.archive_bookings(older_than_days=30, batch_size=2), 0)
+
+        count = self.db.get_connection().execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
+        self.assertEqual(count, 1)
+        history = self.db.get_user_history(123)
+        self.assertEqual([booking['booking_date'] for booking in history], [tomorrow] + [old_date] * 3)
+        self.assertEqual(history[1]['status'], 'completed')
+
+    def test_bookings_page(self):
+        """Тест: keyset-пагинация проходит все записи вперёд и назад"""
+        from timetable import SLOT_TIMES
+
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        for user_id in range(2):
+            for time_str in SLOT_TIMES:
+                self.db.add_booking(user_id, tomorrow, time_str, 'Мойка', '+79991234567')
+        total = len(SLOT_TIMES) * 2
+
+        seen = []
+        page = self.db.get_bookings_page(limit=3)
+        self.assertFalse(page['has_prev'])
+        while True:
+            seen.extend(booking['id'] for booking in page['bookings'])
+            if not page['has_next']:
+                break
+            last = page['bookings'][-1]
+            page = self.db.get_bookings_page(after=(last['booking_date'], last['booking_time'], last['id']), limit=3)
+
+        self.assertEqual(len(seen), total)
+        self.assertEqual(seen, [booking['id'] for booking in self.db.get_all_bookings()])
+
+        first = page['bookings'][0]
+        previous = self.db.get_bookings_page(before=(first['booking_date'], first['booking_time'], first['id']), limit=3)
+        self.assertEqual([booking['id'] for booking in previous['bookings']], seen[-len(page['bookings']) - 3:-len(page['bookings'])])
+
+        day_page = self.db.get_bookings_page(booking_date=tomorrow, limit=100)
+        self.assertEqual(len(day_page['bookings']), total)
+        self.assertEqual(self.db.get_booking_counts_by_date(), [(tomorrow, total)])
+
+    def test_availability_cache(self):
+        """Тест: повторный выбор даты обслуживается из кэша, запись сбрасывает кэш"""
+        from timetable import SLOT_TIMES
+
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        slot = SLOT_TIMES[0]
+
+        first = self.db.get_available_times(tomorrow)
+        misses = self.db.availability.misses
+        second = self.db.get_available_times(tomorrow)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.db.availability.misses, misses)
+        self.assertGreaterEqual(self.db.availability.hits, 1)
+
+        self.db.add_booking(123, tomorrow, slot, 'Мойка', '+79991234567')
+        times = {item['time']: item['available'] for item in self.db.get_available_times(tomorrow)}
+        self.assertEqual(times[slot], second[0]['available'] - 1)
+
+        booking_id = self.db.get_user_bookings(123)[0]['id']
+        self.db.cancel_booking(booking_id, 123)
+        self.assertEqual(self.db.get_available_times(tomorrow), first)
+
+    def test_availability_cache_ttl(self):
+        """Тест: устаревшие записи кэша перечитываются из БД"""
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self.db.availability.ttl = 0
+
+        self.db.get_available_times(tomorrow)
+        self.db.get_available_times(tomorrow)
+
+        self.assertEqual(self.db.availability.hits, 0)
+        self.assertEqual(self.db.availability.misses, 2)
+
+    def test_connection_reused_per_thread(self):
+        """Тест: подключение переиспользуется в пределах потока"""
+        conn = self.db.get_connection()
+        conn.close()
+        self.assertIs(self.db.get_connection(), conn)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.db.get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_wal_mode(self):
+        """Тест: БД работает в режиме WAL"""
+        conn = self.db.get_connection()
+        mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_close_discards_uncommitted(self):
+        """Тест: close() откатывает незакоммиченные изменения, как обычное подключение"""
+        conn = self.db.get_connection()
+        conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'x')")
+        conn.close()
+
+        count = self.db.get_connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        self.assertEqual(count, 0)
+
+
+class TestSqlTrace(unittest.TestCase):
+    """Тесты для трассировки SQL-запросов"""
+
+    def setUp(self):
+        self.test_db_path = 'test_sqltrace.db'
+        remove_db_files(self.test_db_path)
+        self.db = Database(self.test_db_path, trace=True)
+
+    def tearDown(self):
+        self.db.close()
+        remove_db_files(self.test_db_path)
+
+    def test_statement_aggregates(self):
+        """Тест: запросы замеряются без изменения методов, результаты не меняются"""
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self.db.tracer.reset()
+        self.db.add_user(123, 'testuser', 'Test')
+        self.db.book_slot(123, tomorrow, '10:30', 'Мойка', '+79991234567')
+        for _ in range(3):
+            bookings = self.db.get_user_bookings(123)
+        self.assertEqual(len(bookings), 1)
+        self.assertEqual(bookings[0]['booking_time'], '10:30')
+
+        stats = {item['statement']: item for item in self.db.sql_stats()}
+        user_bookings = next(item for statement, item in stats.items()
+                             if statement.startswith('SELECT * FROM bookings WHERE user_id = ?'))
+        self.assertEqual(user_bookings['calls'], 3)
+        self.assertEqual(user_bookings['rows'], 3)
+        self.assertGreaterEqual(user_bookings['max_ms'], user_bookings['mean_ms'])
+
+    def test_connection_execute_traced(self):
+        """Тест: сокращения conn.execute()/executemany() тоже замеряются"""
+        self.db.tracer.reset()
+        conn = self.db.get_connection()
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)', [(1, 'a'), (2, 'b')])
+        rows = conn.execute('SELECT user_id FROM users ORDER BY user_id').fetchall()
+        conn.commit()
+        conn.close()
+        self.assertEqual([row['user_id'] for row in rows], [1, 2])
+
+        stats = {item['statement']: item for item in self.db.sql_stats()}
+        self.assertEqual(stats['INSERT INTO users (user_id, username) VALUES (?, ?)']['rows'], 2)
+        self.assertEqual(stats['SELECT user_id FROM users ORDER BY user_id']['rows'], 2)
+
+    def test_slow_query_log(self):
+        """Тест: запросы дольше порога попадают в журнал медленных запросов"""
+        self.db.tracer.slow_query_ms = 0
+        with self.assertLogs('sqltrace.slow', level='WARNING') as logs:
+            self.db.get_all_bookings()
+        self.assertIn('FROM bookings b', logs.output[0])
+        self.assertGreater(self.db.tracer.slow_queries, 0)
+
+
+class TestMigrations(unittest.TestCase):
+    """Тесты для версионных миграций схемы"""
+
+    def setUp(self):
+        self.test_db_path = 'test_migrations.db'
+        remove_db_files(self.test_db_path)
+
+    def tearDown(self):
+        remove_db_files(self.test_db_path)
+
+    def test_fresh_database_is_migrated_once(self):
+        """Тест: новая БД получает последнюю версию, повторный старт ничего не применяет"""
+        import sqlite3
+        from migrations import LATEST_VERSION, migrate, schema_version
+
+        Database(self.test_db_path).close()
+        conn = sqlite3.connect(self.test_db_path)
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        self.assertEqual(migrate(conn), [])
+        conn.close()
+
+    def test_legacy_database_upgrade(self):
+        """Тест: БД первой версии бота обновляется с заполнением новых колонок пачками"""
+        import sqlite3
+        from config import WASH_DURATIONS
+        from migrations import LATEST_VERSION, migrate, schema_version
+        from timetable import SLOT_MINUTES
+
+        conn = sqlite3.connect(self.test_db_path)
+        conn.execute('''
+            CREATE TABLE bookings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                booking_date DATE NOT NULL,
+                booking_time TEXT NOT NULL,
+                service TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                status TEXT DEFAULT 'active',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(booking_date, booking_time, user_id)
+            )
+        ''')
+        conn.executemany(
+            'INSERT INTO bookings (user_id, booking_date, booking_time, service, phone) VALUES (?, ?, ?, ?, ?)',
+            [
+                (1, '2024-01-10', '09:00', 'Седан - Однофазная мойка', '+79990000001'),
+                (2, '2024-01-10', '09:00', 'Внедорожник (SUV) - Двухфазная мойка', '+79990000002'),
+                (3, '2024-01-10', '10:30', 'Полировка', '+79990000003'),
+            ]
+        )
+        conn.commit()
+
+        self.assertEqual(migrate(conn, batch_size=2), list(range(1, LATEST_VERSION + 1)))
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        rows = conn.execute('SELECT car_body_type, wash_type FROM bookings ORDER BY id').fetchall()
+        self.assertEqual(rows, [('sedan', 'single'), ('suv', 'double'), (None, None)])
+        durations = [row[0] for row in conn.execute('SELECT duration FROM bookings ORDER BY id')]
+        self.assertEqual(durations, [WASH_DURATIONS[('sedan', 'single')], WASH_DURATIONS[('suv', 'double')], SLOT_MINUTES])
+        conn.close()
+
+        db = Database(self.test_db_path)
+        self.assertEqual(len(db.get_user_history(2)), 1)
+        db.close()
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Тесты: горячие запросы используют индексы, а не полный просмотр таблицы"""
+
+    def setUp(self):
+        self.test_db_path = 'test_carwash_plans.db'
+        remove_db_files(self.test_db_path)
+        self.db = Database(self.test_db_path)
+
+    def tearDown(self):
+        self.db.close()
+        remove_db_files(self.test_db_path)
+
+    # Частичные индексы содержат только активные записи — их просмотр допустим
+    PARTIAL_INDEXES = ('idx_bookings_active_slot', 'idx_bookings_active_user')
+
+    def assert_no_full_scan(self, method, *args):
+        """Выполнить метод и проверить план каждого его запроса"""
+        conn = self.db.get_connection()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            method(*args)
+        finally:
+            conn.set_trace_callback(None)
+
+        queries = [sql for sql in statements if sql.split()[0].upper() in ('SELECT', 'UPDATE', 'DELETE')]
+        self.assertTrue(queries, f'{method.__name__} не выполнил ни одного запроса')
+        for sql in queries:
+            plan = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+            for detail in plan:
+                self.assertFalse(
+                    detail.startswith('SCAN') and not detail.endswith(self.PARTIAL_INDEXES),
+                    f'{method.__name__}: полный просмотр таблицы\n{sql}\n{plan}'
+                )
+
+    def test_get_all_bookings_plan(self):
+        self.assert_no_full_scan(self.db.get_all_bookings)
+
+    def test_get_user_bookings_plan(self):
+        self.assert_no_full_scan(self.db.get_user_bookings, 123)
+
+    def test_get_available_dates_plan(self):
+        self.assert_no_full_scan(self.db.get_available_dates)
+
+    def test_get_available_times_plan(self):
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self.assert_no_full_scan(self.db.get_available_times, tomorrow)
+
+    def test_get_bookings_page_plan(self):
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self.assert_no_full_scan(self.db.get_bookings_page, (tomorrow, '10:30', 1))
+
+    def test_remove_expired_bookings_plan(self):
+        self.assert_no_full_scan(self.db.remove_expired_bookings)
+
+    def test_get_active_slots_plan(self):
+        self.assert_no_full_scan(self.db.get_active_slots)
+
+    def test_expire_slot_plan(self):
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self.assert_no_full_scan(self.db.expire_slot, tomorrow, '10:30')
+
+    def test_archive_bookings_plan(self):
+        self.assert_no_full_scan(self.db.archive_bookings)
+
+    def test_cancel_booking_plan(self):
+        self.assert_no_full_scan(self.db.cancel_booking, 1, 123)
+
+
+class TestAsyncDatabase(unittest.IsolatedAsyncioTestCase):
+    """Тесты для асинхронной обёртки над БД"""
+
+    def setUp(self):
+        self.test_db_path = 'test_carwash_async.db'
+        remove_db_files(self.test_db_path)
+        self.db = AsyncDatabase(Database(self.test_db_path))
+
+    def tearDown(self):
+        self.db.close()
+        remove_db_files(self.test_db_path)
+
+    async def test_bot_warm_up(self):
+        """Тест: прогрев заполняет кэш доступности и клавиатуры до первого обновления"""
+        from bot import CarWashBot
+
+        bot = CarWashBot(self.db, None, None, None, None)
+        await bot.warm_up()
+        misses = self.db.availability.misses
+
+        available_dates = await self.db.get_available_dates()
+        self.assertIn(tuple(available_dates), bot.keyboards._dates)
+        self.assertEqual(self.db.availability.misses, misses)
+
+    async def test_same_results_as_sync(self):
+        """Тест: асинхронные методы возвращают то же, что и синхронные"""
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        await self.db.add_user(123, 'testuser', 'Test')
+        success = await self.db.add_booking(123, tomorrow, '10:30', 'Базовая мойка', '+79991234567')
+        self.assertTrue(success)
+
+        bookings = await self.db.get_user_bookings(123)
+        self.assertEqual(len(bookings), 1)
+        self.assertEqual(
+            await self.db.get_available_times(tomorrow),
+            self.db.database.get_available_times(tomorrow)
+        )
+
+        booking = await self.db.get_booking(bookings[0]['id'], 123)
+        self.assertEqual(booking['booking_time'], '10:30')
+
+    async def test_runs_off_event_loop_thread(self):
+        """Тест: запросы выполняются не в потоке event loop"""
+        loop_thread = threading.get_ident()
+        worker_thread = await self.db.run(threading.get_ident)
+        self.assertNotEqual(loop_thread, worker_thread)
+
+    async def test_concurrent_calls(self):
+        """Тест: параллельные вызовы не мешают друг другу"""
+        results = await asyncio.gather(*(self.db.get_available_dates() for _ in range(20)))
+        self.assertTrue(all(result == results[0] for result in results))
+
+    async def test_concurrent_bookings_do_not_overbook(self):
+        """Стресс-тест: много пользователей одновременно подтверждают один слот"""
+        from config import MAX_BOOKINGS_PER_SLOT
+
+        self.db.close()
+        self.db = AsyncDatabase(Database(self.test_db_path), workers=16)
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        results = await asyncio.gather(*(
+            self.db.book_slot(user_id, tomorrow, '10:30', 'Мойка', '+79991234567')
+            for user_id in range(50)
+        ))
+
+        self.assertEqual(results.count(BookingResult.BOOKED), MAX_BOOKINGS_PER_SLOT)
+        self.assertEqual(results.count(BookingResult.SLOT_FULL), 50 - MAX_BOOKINGS_PER_SLOT)
+        times = {slot['time'] for slot in await self.db.get_available_times(tomorrow)}
+        self.assertNotIn('10:30', times)
+
+
+class TestNotificationQueue(unittest.IsolatedAsyncioTestCase):
+    """Тесты для фоновой очереди уведомлений"""
+
+    def setUp(self):
+        self.test_db_path = 'test_carwash_notify.db'
+        remove_db_files(self.test_db_path)
+        self.db = AsyncDatabase(Database(self.test_db_path))
+        self.sent = []
+        self.failures = 0
+        self.error = ConnectionError('network down')
+
+    def tearDown(self):
+        self.db.close()
+        remove_db_files(self.test_db_path)
+
+    async def send(self, chat_id, text, parse_mode):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.sent.append((chat_id, text, parse_mode))
+
+    async def wait_until(self, condition):
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail('условие не выполнилось')
+
+    async def test_send_with_retry(self):
+        """Тест: неудачная отправка повторяется, отправленное удаляется из БД"""
+        from notifications import NotificationQueue
+
+        self.failures = 2
+        queue = NotificationQueue(self.db, self.send, retry_delay=0.01)
+        await queue.start()
+        await queue.enqueue(1, 'Новая запись', 'HTML')
+
+        await self.wait_until(lambda: queue.stats()['sent'] == 1)
+        await queue.stop()
+
+        self.assertEqual(self.sent, [(1, 'Новая запись', 'HTML')])
+        self.assertEqual(await self.db.get_pending_notifications(), [])
+        self.assertEqual(queue.stats()['sent'], 1)
+        self.assertEqual(queue.stats()['depth'], 0)
+
+    async def test_permanent_error_not_retried(self):
+        """Тест: BadRequest от Telegram не повторяется, уведомление удаляется"""
+        from telegram.error import BadRequest
+        from notifications import NotificationQueue
+
+        self.failures = 1
+        self.error = BadRequest("Can't parse entities")
+        queue = NotificationQueue(self.db, self.send, retry_delay=0.01)
+        await queue.start()
+        await queue.enqueue(1, '<b>Клиент</b> <', 'HTML')
+
+        await self.wait_until(lambda: queue.stats()['failed'] == 1)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+
+        self.assertEqual(self.sent, [])
+        self.assertEqual(await self.db.get_pending_notifications(), [])
+        self.assertEqual(queue.stats()['depth'], 0)
+
+    async def test_pending_survive_restart(self):
+        """Тест: неотправленные уведомления отправляются после перезапуска"""
+        from notifications import NotificationQueue
+
+        self.failures = 1
+        queue = NotificationQueue(self.db, self.send, retry_delay=60)
+        await queue.start()
+        await queue.enqueue(1, 'Отмена записи')
+        await self.wait_until(lambda: queue.stats()['depth'] == 1 and not self.failures)
+        await queue.stop()
+
+        restarted = NotificationQueue(self.db, self.send)
+        await restarted.start()
+        await self.wait_until(lambda: restarted.stats()['sent'] == 1)
+        await restarted.stop()
+
+        self.assertEqual(self.sent, [(1, 'Отмена записи', None)])
+
+    async def test_gives_up_after_max_attempts(self):
+        """Тест: после исчерпания попыток уведомление удаляется"""
+        from notifications import NotificationQueue
+
+        self.failures = 100
+        queue = NotificationQueue(self.db, self.send, max_attempts=2, retry_delay=0.01)
+        await queue.start()
+        await queue.enqueue(1, 'Новая запись')
+        await self.wait_until(lambda: queue.stats()['failed'] == 1)
+        await queue.stop()
+
+        self.assertEqual(await self.db.get_pending_notifications(), [])
+
+
+class FakeBot:
+    """Заглушка Bot API: запоминает вызовы, может один раз ответить RetryAfter.
+
+    failed_edits — сколько первых правок отклонить с BadRequest.
+    """
+
+    def __init__(self, retry_after=None, failed_edits=0):
+        self.calls = []
+        self.retry_after = retry_after
+        self.failed_edits = failed_edits
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.retry_after is not None:
+            from telegram.error import RetryAfter
+            retry_after, self.retry_after = self.retry_after, None
+            raise RetryAfter(retry_after)
+        self.calls.append(('send', chat_id, text))
+        return text
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        if self.failed_edits:
+            from telegram.error import BadRequest
+            self.failed_edits -= 1
+            await asyncio.sleep(0)
+            raise BadRequest('Message is not modified')
+        self.calls.append(('edit', chat_id, text))
+        return text
+
+
+class TestRateLimitedSender(unittest.IsolatedAsyncioTestCase):
+    """Тесты для отправки сообщений с учётом лимитов Telegram"""
+
+    async def test_per_chat_rate(self):
+        """Тест: сообщения в один чат разносятся по времени, в разные — нет"""
+        from sender import RateLimitedSender
+
+        bot = FakeBot()
+        sender = RateLimitedSender(bot, global_rate=1000, chat_rate=20, chat_burst=1)
+
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(sender.send_message(1, str(i)) for i in range(5)))
+        same_chat = asyncio.get_running_loop().time() - started
+
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(sender.send_message(100 + i, str(i)) for i in range(5)))
+        other_chats = asyncio.get_running_loop().time() - started
+
+        self.assertGreaterEqual(same_chat, 4 / 20 - 0.01)
+        self.assertLess(other_chats, 0.05)
+        self.assertEqual(len(bot.calls), 10)
+
+    async def test_edits_coalesced(self):
+        """Тест: ожидающие правки одного сообщения схлопываются в последнюю"""
+        from sender import RateLimitedSender
+
+        bot = FakeBot()
+        sender = RateLimitedSender(bot, global_rate=1000, chat_rate=10, chat_burst=1)
+        await sender.send_message(1, 'первое')
+
+        results = await asyncio.gather(*(sender.edit_message_text(1, 42, f'правка {i}') for i in range(4)))
+
+        self.assertEqual(bot.calls[1:], [('edit', 1, 'правка 3')])
+        self.assertEqual(results, ['правка 3'] * 4)
+        self.assertEqual(sender.stats()['coalesced_edits'], 3)
+
+    async def test_failed_edit_keeps_next_pending(self):
+        """Тест: ошибка правки не сбрасывает ожидающую правку того же сообщения"""
+        from telegram.error import BadRequest
+        from sender import RateLimitedSender
+
+        bot = FakeBot(failed_edits=1)
+        sender = RateLimitedSender(bot, global_rate=1000, chat_rate=20, chat_burst=1)
+
+        first, second = await asyncio.gather(
+            sender.edit_message_text(1, 42, 'первая'),
+            sender.edit_message_text(1, 42, 'вторая'),
+            return_exceptions=True,
+        )
+
+        self.assertIsInstance(first, BadRequest)
+        self.assertEqual(second, 'вторая')
+        self.assertEqual(bot.calls, [('edit', 1, 'вторая')])
+
+    async def test_retry_after(self):
+        """Тест: после RetryAfter отправка повторяется"""
+        from sender import RateLimitedSender
+
+        bot = FakeBot(retry_after=0)
+        sender = RateLimitedSender(bot)
+
+        await sender.send_message(1, 'привет')
+
+        self.assertEqual(bot.calls, [('send', 1, 'привет')])
+        self.assertEqual(sender.stats()['flood_waits'], 1)
+
+
+class TestPerUserOrdering(unittest.IsolatedAsyncioTestCase):
+    """Тесты для параллельной обработки обновлений с порядком внутри пользователя"""
+
+    async def start(self, max_concurrency, delays=None):
+        """Запустить приложение; delays — задержка обработчика по user_id (с)"""
+        import random
+        from telegram import Update
+        from telegram.ext import ApplicationBuilder, TypeHandler
+        from ordering import PerUserOrderedApplication
+        from stub_bot import StubRequest, STUB_TOKEN
+
+        self.processed = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        delays = delays or {}
+
+        async def handler(update, context):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            user_id = update.effective_user.id
+            await asyncio.sleep(delays.get(user_id, random.uniform(0, 0.01)))
+            self.processed.append((user_id, update.update_id))
+            self.in_flight -= 1
+
+        self.application = (
+            ApplicationBuilder()
+            .token(STUB_TOKEN)
+            .request(StubRequest())
+            .application_class(PerUserOrderedApplication, kwargs={'max_concurrency': max_concurrency})
+            .build()
+        )
+        self.application.add_handler(TypeHandler(Update, handler))
+        await self.application.initialize()
+        await self.application.start()
+        self.make_update = lambda update_id, user_id: Update.de_json({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+                'text': 'hi',
+            },
+        }, self.application.bot)
+
+    async def asyncTearDown(self):
+        await self.application.stop()
+        await self.application.shutdown()
+
+    async def wait_processed(self, count):
+        while len(self.processed) < count:
+            await asyncio.sleep(0.01)
+
+    async def test_per_user_order_with_concurrency(self):
+        """Тест: обновления одного пользователя идут по порядку, разных — параллельно"""
+        await self.start(max_concurrency=8)
+        for update_id in range(60):
+            await self.application.update_queue.put(self.make_update(update_id, update_id % 4))
+        await self.wait_processed(60)
+
+        for user_id in range(4):
+            order = [update_id for user, update_id in self.processed if user == user_id]
+            self.assertEqual(order, sorted(order))
+        self.assertGreater(self.max_in_flight, 1)
+        self.assertLessEqual(self.max_in_flight, 4)
+
+    async def test_backlog_does_not_delay_other_users(self):
+        """Тест: очередь обновлений одного пользователя не задерживает другого"""
+        await self.start(max_concurrency=4, delays={1: 0.05, 2: 0})
+        for update_id in range(6):
+            await self.application.update_queue.put(self.make_update(update_id, 1))
+        await self.application.update_queue.put(self.make_update(6, 2))
+        await self.wait_processed(7)
+
+        # Второй пользователь обработан, пока первый ещё на своём первом обновлении
+        self.assertEqual(self.processed[0], (2, 6))
+        self.assertEqual([update_id for user, update_id in self.processed[1:]], list(range(6)))
+        self.assertEqual(self.max_in_flight, 2)
+
+
+class TestExpiryScheduler(unittest.IsolatedAsyncioTestCase):
+    """Тесты для завершения записей по окончании слота"""
+
+    def setUp(self):
+        self.test_db_path = 'test_expiry.db'
+        remove_db_files(self.test_db_path)
+        self.db = AsyncDatabase(Database(self.test_db_path))
+        self.today = datetime.now().date()
+
+    def tearDown(self):
+        self.db.close()
+        remove_db_files(self.test_db_path)
+
+    async def book(self, user_id, day, time_str):
+        date_str = (self.today + timedelta(days=day)).strftime('%Y-%m-%d')
+        await self.db.add_user(user_id, 'user', 'User')
+        await self.db.add_booking(user_id, date_str, time_str, 'Седан - Комплекс', '+79991234567')
+        return date_str
+
+    async def test_expires_slots_in_order(self):
+        """Тест: завершаются только закончившиеся слоты, ближайший — первым"""
+        from expiry import ExpiryScheduler
+
+        yesterday = await self.book(1, -1, '10:30')
+        tomorrow = await self.book(2, 1, '10:30')
+        await self.book(3, 1, '12:00')
+
+        scheduler = ExpiryScheduler(self.db, slot_minutes=90)
+        await scheduler.start()
+        try:
+            # Вчерашняя запись завершена при запуске, остальные ждут своего времени
+            self.assertEqual(scheduler.expired, 1)
+            self.assertEqual(scheduler.next_expiry(), datetime.strptime(f'{tomorrow} 12:00', '%Y-%m-%d %H:%M'))
+
+            await scheduler.expire_due(now=datetime.strptime(f'{tomorrow} 12:30', '%Y-%m-%d %H:%M'))
+            self.assertEqual(scheduler.expired, 2)
+            self.assertEqual(await self.db.get_user_bookings(2), [])
+            self.assertEqual(len(await self.db.get_user_bookings(3)), 1)
+
+            # Новая запись на более ранний слот встаёт в начало очереди
+            scheduler.add(yesterday, '09:00')
+            self.assertEqual(scheduler.next_expiry(), datetime.strptime(f'{yesterday} 10:30', '%Y-%m-%d %H:%M'))
+        finally:
+            await scheduler.stop()
+
+    async def test_expires_by_wash_duration(self):
+        """Тест: записи с одним началом завершаются каждая по окончании своей мойки"""
+        from expiry import ExpiryScheduler
+
+        tomorrow = (self.today + timedelta(days=1)).strftime('%Y-%m-%d')
+        await self.db.add_user(1, 'user', 'User')
+        await self.db.add_booking(1, tomorrow, '10:30', 'Седан', '+79991234567', 'sedan', 'single')
+        await self.db.add_booking(2, tomorrow, '10:30', 'Грузовик', '+79991234567', 'truck', 'double')
+
+        scheduler = ExpiryScheduler(self.db)
+        await scheduler.start()
+        try:
+            self.assertEqual(scheduler.next_expiry(), datetime.strptime(f'{tomorrow} 11:30', '%Y-%m-%d %H:%M'))
+            await scheduler.expire_due(now=datetime.strptime(f'{tomorrow} 12:00', '%Y-%m-%d %H:%M'))
+            self.assertEqual(await self.db.get_user_bookings(1), [])
+            self.assertEqual(len(await self.db.get_user_bookings(2)), 1)
+            self.assertEqual(scheduler.next_expiry(), datetime.strptime(f'{tomorrow} 13:30', '%Y-%m-%d %H:%M'))
+        finally:
+            await scheduler.stop()
+
+    async def test_resync_picks_up_external_bookings(self):
+        """Тест: записи, добавленные в обход бота, подхватываются сверкой с БД"""
+        from expiry import ExpiryScheduler
+
+        scheduler = ExpiryScheduler(self.db, slot_minutes=90, resync_interval=0.05)
+        await scheduler.start()
+        try:
+            self.assertIsNone(scheduler.next_expiry())
+            # Как examples.py или ручной SQL: без ExpiryScheduler.add
+            await self.book(1, -1, '10:30')
+            tomorrow = await self.book(2, 1, '12:00')
+
+            for _ in range(100):
+                if scheduler.next_expiry() is not None:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(scheduler.expired, 1)
+            self.assertEqual(await self.db.get_user_bookings(1), [])
+            self.assertEqual(scheduler.next_expiry(), datetime.strptime(f'{tomorrow} 13:30', '%Y-%m-%d %H:%M'))
+        finally:
+            await scheduler.stop()
+
+    async def test_expire_slot_in_batches(self):
+        """Тест: записи слота переводятся в completed пачками"""
+        date_str = (self.today + timedelta(days=1)).strftime('%Y-%m-%d')
+        conn = self.db.database.get_connection()
+        conn.executemany(
+            "INSERT INTO bookings (user_id, booking_date, booking_time, service, phone) VALUES (?, ?, '10:30', 's', 'p')",
+            [(user_id, date_str) for user_id in range(7)]
+        )
+        conn.commit()
+        conn.close()
+
+        expired = await self.db.run(self.db.database.expire_slot, date_str, '10:30', 2)
+        self.assertEqual(expired, 7)
+        self.assertEqual(await self.db.get_active_slots(), [])
+
+
+class TestSQLitePersistence(unittest.IsolatedAsyncioTestCase):
+    """Тесты для хранения незавершённых диалогов в БД"""
+
+    def setUp(self):
+        self.test_db_path = 'test_persistence.db'
+        self.seen = []
+
+    def tearDown(self):
+        remove_db_files(self.test_db_path)
+
+    async def start_application(self):
+        from telegram import Update
+        from telegram.ext import ApplicationBuilder, ConversationHandler, MessageHandler, filters
+        from ordering import PerUserOrderedApplication
+        from persistence import SQLitePersistence
+        from stub_bot import StubRequest, STUB_TOKEN
+
+        async def first(update, context):
+            context.user_data['car_body_type'] = update.message.text
+            return 1
+
+        async def second(update, context):
+            self.seen.append(dict(context.user_data))
+            return ConversationHandler.END
+
+        db = AsyncDatabase(Database(self.test_db_path))
+        persistence = SQLitePersistence(db, update_interval=0.05)
+        application = (
+            ApplicationBuilder()
+            .token(STUB_TOKEN)
+            .request(StubRequest())
+            .application_class(PerUserOrderedApplication, kwargs={'max_concurrency': 8})
+            .persistence(persistence)
+            .build()
+        )
+        application.add_handler(ConversationHandler(
+            entry_points=[MessageHandler(filters.TEXT, first)],
+            states={1: [MessageHandler(filters.TEXT, second)]},
+            fallbacks=[],
+            name='booking',
+            persistent=True,
+        ))
+        await application.initialize()
+        await application.start()
+        self.make_update = lambda update_id, text: Update.de_json({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': 0,
+                'chat': {'id': 42, 'type': 'private'},
+                'from': {'id': 42, 'is_bot': False, 'first_name': 'Test'},
+                'text': text,
+            },
+        }, application.bot)
+        return application, persistence, db
+
+    async def stop_application(self, application, db):
+        await application.stop()
+        await application.shutdown()
+        db.close()
+
+    async def test_conversation_survives_restart(self):
+        """Тест: после перезапуска диалог продолжается с сохранённого шага"""
+        application, persistence, db = await self.start_application()
+        await application.process_update(self.make_update(1, 'sedan'))
+        await asyncio.sleep(0.01)
+        await self.stop_application(application, db)
+        self.assertEqual(self.seen, [])
+
+        application, persistence, db = await self.start_application()
+        await application.process_update(self.make_update(2, 'далее'))
+        while not self.seen:
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.seen, [{'car_body_type': 'sedan'}])
+
+        # Завершённый диалог удаляется из БД
+        await self.stop_application(application, db)
+        data = Database(self.test_db_path)
+        self.assertEqual(data.load_conversation_data(42)[1], [])
+        data.close()
+
+    async def test_writes_are_batched(self):
+        """Тест: изменения нескольких пользователей уходят в БД одной записью"""
+        application, persistence, db = await self.start_application()
+        for user_id in range(20):
+            await persistence.update_user_data(user_id, {'phone': str(user_id)})
+            await persistence.update_conversation('booking', (user_id, user_id), 1)
+        await persistence.flush()
+        self.assertEqual(persistence.writes, 1)
+        await self.stop_application(application, db)
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    """Тесты для метрик обработчиков, БД и воронки записи"""
+
+    async def test_handler_metrics_and_funnel(self):
+        """Тест: замер обработчиков, переходы состояний и потери в воронке"""
+        from metrics import Metrics
+
+        metrics = Metrics({1: 'SELECT_CAR_BODY', 2: 'SELECT_WASH_TYPE', 3: 'SELECT_DATE'})
+        metrics.FUNNEL = ('SELECT_CAR_BODY', 'SELECT_WASH_TYPE', 'SELECT_DATE')
+
+        async def choose(update, context):
+            return update
+
+        async def broken(update, context):
+            raise ValueError
+
+        to_body = metrics.instrument_handler(choose, 'SELECT_ACTION')
+        to_wash = metrics.instrument_handler(choose, 'SELECT_CAR_BODY')
+        for _ in range(4):
+            await to_body(1, None)
+        for _ in range(3):
+            await to_wash(2, None)
+        # Возврат назад не считается продвижением по воронке
+        await metrics.instrument_handler(choose, 'SELECT_WASH_TYPE')(1, None)
+        with self.assertRaises(ValueError):
+            await metrics.instrument_handler(broken, 'SELECT_CAR_BODY')(None, None)
+
+        self.assertEqual(metrics.handlers['choose'].count, 8)
+        self.assertEqual(metrics.handler_errors['broken'], 1)
+        self.assertEqual(metrics.transitions[('SELECT_ACTION', 'SELECT_CAR_BODY')], 4)
+        funnel = metrics.funnel()
+        self.assertEqual([(step, count) for step, count, _ in funnel][:3],
+                         [('SELECT_CAR_BODY', 4), ('SELECT_WASH_TYPE', 3), ('SELECT_DATE', 0)])
+        self.assertAlmostEqual(funnel[1][2], 0.25)
+
+    async def test_db_metrics_and_endpoint(self):
+        """Тест: методы БД замеряются, метрики отдаются по HTTP в формате Prometheus"""
+        from metrics import Metrics, MetricsServer
+
+        test_db_path = 'test_metrics.db'
+        metrics = Metrics()
+        db = AsyncDatabase(Database(test_db_path), metrics=metrics)
+        tomorrow = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+        try:
+            await db.get_available_dates()
+            await db.book_slot(1, tomorrow, '10:30', 'Мойка', '+79991234567')
+            metrics.add_collector('availability_cache', db.availability.stats)
+
+            server = MetricsServer(metrics, '127.0.0.1', 0)
+            await server.start()
+            port = server._server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response = (await reader.read()).decode('utf-8')
+            writer.close()
+            await server.stop()
+        finally:
+            db.close()
+            remove_db_files(test_db_path)
+
+        self.assertTrue(response.startswith('HTTP/1.1 200 OK'))
+        self.assertIn('carwash_db_latency_seconds_count{method="get_available_dates"} 1', response)
+        self.assertIn('carwash_booking_results_total{result="booked"} 1', response)
+        self.assertIn('carwash_availability_cache_misses', response)
+
+
+class TestDaySchedule(unittest.TestCase):
+    """Тесты для интервального индекса занятости постов"""
+
+    def test_peak_and_fits(self):
+        """Тест: пересечения считаются по всему отрезку мойки"""
+        from schedule import DaySchedule
+
+        schedule = DaySchedule([(540, 660), (600, 690), (720, 780)], bays=2)
+        self.assertEqual(schedule.peak(480, 540), 0)
+        self.assertEqual(schedule.peak(540, 600), 1)
+        self.assertEqual(schedule.peak(630, 700), 2)
+        self.assertEqual(schedule.peak(690, 720), 0)
+        self.assertTrue(schedule.fits(660, 60))
+        self.assertFalse(schedule.fits(500, 120))
+        self.assertEqual(schedule.free_bays(700, 800), 1)
+
+    def test_open_starts(self):
+        """Тест: времена начала учитывают длительность мойки и конец дня"""
+        from schedule import DaySchedule
+        from timetable import DAY_CLOSES, SLOT_GRID
+
+        schedule = DaySchedule([(SLOT_GRID[0].minutes, SLOT_GRID[1].minutes + 1)], bays=1)
+        starts = [slot for slot, free in schedule.open_starts(60)]
+        self.assertNotIn(SLOT_GRID[0], starts)
+        self.assertNotIn(SLOT_GRID[1], starts)
+        self.assertEqual(starts, [slot for slot in SLOT_GRID[2:] if slot.minutes + 60 <= DAY_CLOSES])
+
+
+class TestTimetable(unittest.TestCase):
+    """Тесты для сетки слотов и таблицы дат"""
+
+    def test_slot_grid(self):
+        """Тест: сетка слотов строится из рабочих часов"""
+        from timetable import build_slot_grid
+
+        grid = build_slot_grid({'start': 9, 'end': 12, 'interval': 0.75})
+        self.assertEqual([slot.time for slot in grid], ['09:00', '09:45', '10:30', '11:15'])
+        self.assertEqual(grid[1].minutes, 9 * 60 + 45)
+
+    def test_date_table(self):
+        """Тест: таблица дат содержит окно записи и подписи дней"""
+        from timetable import DateTable
+
+        table = DateTable(days_ahead=3)
+        today = datetime.now().date()
+
+        self.assertEqual([day.date for day in table.days()], [today + timedelta(days=i) for i in range(4)])
+        day = table.get('2024-01-15')
+        self.assertEqual(day.label, 'Пн, 15.01.2024')
+        self.assertIs(table.get(today), table.get(today.strftime('%Y-%m-%d')))
+
+    def test_date_table_rolls_over(self):
+        """Тест: после смены суток таблица пересобирается"""
+        from timetable import DateTable
+
+        table = DateTable(days_ahead=3)
+        table.days()
+        table._today = datetime.now().date() - timedelta(days=1)
+
+        self.assertEqual(table.today.date, datetime.now().date())
+
+
+class TestKeyboards(unittest.TestCase):
+    """Тесты для реестра клавиатур"""
+
+    def test_static_menus_built_once(self):
+        """Тест: статические меню создаются один раз и не изменяются"""
+        from config import CAR_BODY_TYPES
+        from keyboards import Keyboards
+
+        keyboards = Keyboards()
+        markup = keyboards.car_body
+
+        self.assertIs(keyboards.car_body, markup)
+        self.assertEqual(len(markup.inline_keyboard), len(CAR_BODY_TYPES) + 1)
+        with self.assertRaises(AttributeError):
+            markup.inline_keyboard = ()
+
+    def test_date_keyboard_cached(self):
+        """Тест: клавиатура дат переиспользуется, пока набор дат не изменился"""
+        from keyboards import Keyboards
+
+        keyboards = Keyboards()
+        today = datetime.now().date()
+        dates = [today + timedelta(days=i) for i in range(3)]
+
+        markup = keyboards.dates(dates)
+        self.assertIs(keyboards.dates(list(dates)), markup)
+        self.assertIsNot(keyboards.dates(dates[1:]), markup)
+        self.assertEqual(markup.inline_keyboard[0][0].callback_data, f"date_{today.strftime('%Y-%m-%d')}")
+
 
 class TestPhoneValidation(unittest.TestCase):
     """Тесты для валидации номера телефона"""
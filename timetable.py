@@ -0,0 +1,100 @@
+"""
+Сетка слотов и календарь дат для записи.
+
+Сетка слотов (возможных времён начала) строится один раз из WORKING_HOURS,
+таблица дат — на окно DAYS_AHEAD и пересобирается при первом обращении
+после полуночи. Длительность мойки зависит от услуги (WASH_DURATIONS).
+"""
+
+from collections import namedtuple
+from datetime import date as date_type, datetime, timedelta
+from config import DAYS_AHEAD, WORKING_HOURS, WASH_DURATIONS
+
+DAY_NAMES = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+
+# Слот рабочего дня: время 'HH:MM' и минуты от начала суток
+Slot = namedtuple('Slot', ['time', 'minutes'])
+
+# День календаря: дата, 'YYYY-MM-DD', 'DD.MM.YYYY', 'Пн' и подпись 'Пн, DD.MM.YYYY'
+Day = namedtuple('Day', ['date', 'iso', 'display', 'day_name', 'label'])
+
+
+def build_slot_grid(working_hours=WORKING_HOURS):
+    """Построить сетку слотов рабочего дня"""
+    start_time = working_hours['start'] * 60  # Переводим в минуты
+    end_time = working_hours['end'] * 60
+    interval = int(working_hours['interval'] * 60)
+    return tuple(
+        Slot(f"{minutes // 60:02d}:{minutes % 60:02d}", minutes)
+        for minutes in range(start_time, end_time, interval)
+    )
+
+
+SLOT_GRID = build_slot_grid()
+SLOT_TIMES = tuple(slot.time for slot in SLOT_GRID)
+# Длительность слота в минутах: столько длится запись без указанного типа мойки
+SLOT_MINUTES = int(WORKING_HOURS['interval'] * 60)
+# Минуты от начала суток, к которым мойка должна закончиться: конец последнего слота сетки
+DAY_CLOSES = SLOT_GRID[-1].minutes + SLOT_MINUTES
+
+
+def to_minutes(time_str):
+    """'HH:MM' -> минуты от начала суток"""
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def wash_duration(car_body_type, wash_type):
+    """Длительность мойки в минутах для типа кузова и типа мойки"""
+    return WASH_DURATIONS.get((car_body_type, wash_type), SLOT_MINUTES)
+
+
+def make_day(date):
+    """Собрать описание дня"""
+    display = date.strftime('%d.%m.%Y')
+    day_name = DAY_NAMES[date.weekday()]
+    return Day(date, date.strftime('%Y-%m-%d'), display, day_name, f"{day_name}, {display}")
+
+
+class DateTable:
+    """Скользящая таблица дат записи: сегодня и DAYS_AHEAD дней вперёд"""
+
+    def __init__(self, days_ahead=DAYS_AHEAD):
+        self.days_ahead = days_ahead
+        self._today = None
+        self._days = ()
+        self._by_key = {}
+
+    def _refresh(self):
+        today = date_type.today()
+        if today == self._today:
+            return
+        days = tuple(make_day(today + timedelta(days=i)) for i in range(self.days_ahead + 1))
+        by_key = {}
+        for day in days:
+            by_key[day.iso] = day
+            by_key[day.date] = day
+        self._days, self._by_key, self._today = days, by_key, today
+
+    def days(self):
+        """Все дни окна записи"""
+        self._refresh()
+        return self._days
+
+    @property
+    def today(self):
+        """Сегодняшний день"""
+        return self.days()[0]
+
+    def get(self, key):
+        """Описание дня по 'YYYY-MM-DD' или объекту date (в том числе вне окна)"""
+        self._refresh()
+        day = self._by_key.get(key)
+        if day is None:
+            if isinstance(key, str):
+                key = datetime.strptime(key, '%Y-%m-%d').date()
+            day = make_day(key)
+        return day
+
+
+DATE_TABLE = DateTable()
@@ -0,0 +1,182 @@
+"""
+Нагрузочный стенд для режима webhook.
+
+Отправляет POST-запросы с JSON обновлений на webhook-эндпоинт бота и
+измеряет пропускную способность (запросов в секунду) и задержку ответа.
+
+Примеры:
+    # Поднять бота локально с заглушкой Bot API и прогнать синтетические /start
+    python webhook_bench.py --serve --requests 2000 --concurrency 50
+
+    # Прогнать записанные обновления против уже запущенного бота
+    python webhook_bench.py --url http://127.0.0.1:8443/telegram --secret SECRET --updates updates.json
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def synthetic_updates(count, users=100):
+    """Сгенерировать обновления с командой /start от разных пользователей"""
+    updates = []
+    for i in range(count):
+        user_id = 1000 + i % users
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+        updates.append({
+            'update_id': i + 1,
+            'message': {
+                'message_id': i + 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+                'from': user,
+                'text': '/start',
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            },
+        })
+    return updates
+
+
+def load_updates(path, count):
+    """Загрузить записанные обновления (JSON-список) и размножить до count штук"""
+    with open(path, encoding='utf-8') as f:
+        recorded = json.load(f)
+    updates = []
+    for i in range(count):
+        update = copy.deepcopy(recorded[i % len(recorded)])
+        update['update_id'] = i + 1
+        updates.append(update)
+    return updates
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+async def post_updates(url, secret, updates, concurrency):
+    """Отправить обновления и вернуть задержки (с), коды ответов и общее время"""
+    latencies = []
+    statuses = Counter()
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=concurrency)) as client:
+        headers = {SECRET_HEADER: secret} if secret else {}
+
+        async def worker():
+            while not queue.empty():
+                update = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=update, headers=headers)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return sorted(latencies), statuses, elapsed
+
+
+async def serve_locally(port, secret, db_path):
+    """Поднять бота в режиме webhook с заглушкой Bot API"""
+    from bot import build_application
+    from stub_bot import StubRequest, STUB_TOKEN
+
+    request = StubRequest()
+    application = build_application(token=STUB_TOKEN, request=request, db_path=db_path)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.updater.start_webhook(
+        listen='127.0.0.1',
+        port=port,
+        url_path='telegram',
+        webhook_url=f'http://127.0.0.1:{port}/telegram',
+        secret_token=secret,
+    )
+    await application.start()
+    return application, request
+
+
+async def stop_locally(application):
+    await application.updater.stop()
+    await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+async def run(args):
+    if args.updates:
+        updates = load_updates(args.updates, args.requests)
+    else:
+        updates = synthetic_updates(args.requests)
+
+    application = request = None
+    url, secret = args.url, args.secret
+    db_dir = tempfile.TemporaryDirectory()
+    if args.serve:
+        secret = secret or 'bench-secret'
+        url = f'http://127.0.0.1:{args.port}/telegram'
+        application, request = await serve_locally(args.port, secret, os.path.join(db_dir.name, 'bench.db'))
+
+    try:
+        latencies, statuses, elapsed = await post_updates(url, secret, updates, args.concurrency)
+    finally:
+        if application is not None:
+            await stop_locally(application)
+        db_dir.cleanup()
+
+    report = {
+        'requests': len(updates),
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(updates) / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+            'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        'statuses': {str(status): count for status, count in statuses.items()},
+    }
+    if request is not None:
+        report['bot_api_calls'] = dict(request.calls)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест webhook-эндпоинта бота')
+    parser.add_argument('--url', help='адрес webhook-эндпоинта, например http://127.0.0.1:8443/telegram')
+    parser.add_argument('--secret', default='', help='значение заголовка X-Telegram-Bot-Api-Secret-Token')
+    parser.add_argument('--updates', help='JSON-файл со списком записанных обновлений')
+    parser.add_argument('--requests', type=int, default=1000, help='сколько запросов отправить')
+    parser.add_argument('--concurrency', type=int, default=20, help='одновременных запросов')
+    parser.add_argument('--serve', action='store_true', help='поднять бота локально с заглушкой Bot API')
+    parser.add_argument('--port', type=int, default=18443, help='порт для --serve')
+    args = parser.parse_args()
+
+    if not args.serve and not args.url:
+        parser.error('нужно указать --url или --serve')
+
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()